@@ -0,0 +1,116 @@
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from storage import DEFAULT_LEDGER
+
+# Groups smaller than this have no meaningful spread to compare against
+MIN_GROUP_SIZE = 8
+DEFAULT_THRESHOLDS = {"iqr": 1.5, "zscore": 3.0}
+# An iqr group's range counts as at least this fraction of its median (and at least one cent),
+# so scores stay relative to the amounts even where the quartiles coincide
+MIN_RELATIVE_SPREAD = 0.05
+
+
+def group_codes(keys: Iterable, codes: Optional[dict] = None) -> np.ndarray:
+    """Dense integer code per row for hashable keys, assigned in one pass over a dict.
+
+    Passing the same `codes` dict for every batch keeps codes consistent across batches.
+    """
+    codes = {} if codes is None else codes
+    return np.fromiter((codes.setdefault(key, len(codes)) for key in keys), dtype=np.int64)
+
+
+def pair_codes(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """Dense integer code per row for each distinct (first, second) pair of integer columns."""
+    if not len(first):
+        return np.zeros(0, dtype=np.int64)
+    _, inverse = np.unique(np.column_stack([first, second]), axis=0, return_inverse=True)
+    return inverse.reshape(-1).astype(np.int64)
+
+
+def duplicate_groups(codes: np.ndarray, days: np.ndarray, window_days: int) -> List[np.ndarray]:
+    """Row indexes of each run of same-key rows posted within window_days of the previous one.
+
+    Sorting by (key, day) puts candidates next to each other, so only
+    neighbours are compared and the whole scan is O(n log n).
+    """
+    if len(codes) < 2:
+        return []
+    order = np.lexsort((days, codes))
+    sorted_codes, sorted_days = codes[order], days[order]
+    linked = (sorted_codes[1:] == sorted_codes[:-1]) & (sorted_days[1:] - sorted_days[:-1] <= window_days)
+    # A run starts wherever a row is not linked to the one before it
+    starts = np.flatnonzero(np.concatenate([[True], ~linked]))
+    sizes = np.diff(np.concatenate([starts, [len(order)]]))
+    return [order[start:start + size] for start, size in zip(starts[sizes > 1], sizes[sizes > 1])]
+
+
+def outlier_scores(codes: np.ndarray, amounts: np.ndarray, method: str = "iqr") -> Tuple[np.ndarray, np.ndarray]:
+    """Score every amount against the others in its group and return (score, typical amount).
+
+    "zscore" measures standard deviations from the group mean. "iqr" measures
+    interquartile ranges beyond the nearer quartile (0 inside the quartiles)
+    and reports the median as typical. The range is floored at
+    MIN_RELATIVE_SPREAD of the median, so a group whose quartiles coincide,
+    such as a fixed-price subscription, still scores in the same unit: at the
+    default threshold, an amount 7.5% away from the usual price stands out.
+    Rows in groups smaller than MIN_GROUP_SIZE, or zscore groups without any
+    spread, score 0.
+    """
+    amounts = amounts.astype(np.float64)
+    groups = int(codes.max()) + 1 if len(codes) else 0
+    sizes = np.bincount(codes, minlength=groups)
+    scores = np.zeros(len(amounts))
+
+    if method == "zscore":
+        means = np.bincount(codes, weights=amounts, minlength=groups) / np.maximum(sizes, 1)
+        variances = np.bincount(codes, weights=amounts ** 2, minlength=groups) / np.maximum(sizes, 1) - means ** 2
+        spread = np.sqrt(np.maximum(variances, 0))[codes]
+        typical = means[codes]
+        np.divide(amounts - typical, spread, out=scores, where=spread > 0)
+    else:
+        # Quantiles of every group at once: sort by (group, amount) and interpolate inside each group's slice
+        order = np.lexsort((amounts, codes))
+        sorted_amounts = amounts[order]
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+        def quantile(fraction: float) -> np.ndarray:
+            position = starts + fraction * np.maximum(sizes - 1, 0)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.minimum(np.ceil(position).astype(np.int64), len(sorted_amounts) - 1)
+            weight = position - lower
+            return sorted_amounts[lower] * (1 - weight) + sorted_amounts[upper] * weight
+
+        first, median, third = (quantile(fraction)[codes] for fraction in (0.25, 0.5, 0.75))
+        spread = np.maximum(third - first, np.maximum(MIN_RELATIVE_SPREAD * np.abs(median), 1))
+        typical = median
+        distance = np.where(amounts > third, amounts - third, np.where(amounts < first, amounts - first, 0))
+        scores = distance / spread
+
+    scores[sizes[codes] < MIN_GROUP_SIZE] = 0
+    return scores, typical
+
+
+def main(
+    ledger: str = DEFAULT_LEDGER,
+    window_days: int = 3,
+    method: str = "iqr",
+    threshold: Optional[float] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+):
+    """Report duplicate postings and unusual amounts in a ledger as JSON, e.g. from a nightly cron job."""
+    import asyncio
+    import json
+    from server import compute_anomalies, transaction_filter
+
+    filters = transaction_filter(start_date, end_date, None, [], None, None)
+    report = asyncio.run(compute_anomalies(ledger, window_days, method, threshold, filters))
+    print(json.dumps(report.dict(), indent=2))
+
+
+if __name__ == "__main__":
+    import typer
+
+    typer.run(main)
@@ -0,0 +1,75 @@
+from datetime import date
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Weeks start on Monday; 1970-01-05 is the first Monday after the datetime64 epoch
+EPOCH_MONDAY = 4
+
+
+def bucket_starts(days: np.ndarray, granularity: str) -> np.ndarray:
+    """Map datetime64[D] values to the first day of their day, week or month bucket."""
+    if granularity == "month":
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    if granularity == "week":
+        ordinals = days.astype(np.int64)
+        return (ordinals - (ordinals - EPOCH_MONDAY) % 7).astype("datetime64[D]")
+    return days
+
+
+def bucket_positions(starts: np.ndarray, first: np.datetime64, granularity: str) -> np.ndarray:
+    if granularity == "month":
+        return (starts.astype("datetime64[M]") - first.astype("datetime64[M]")).astype(np.int64)
+    step = 7 if granularity == "week" else 1
+    return (starts - first).astype(np.int64) // step
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    # Prefix sums give every window total at once; leading buckets average over the shorter history they have
+    totals = np.concatenate([[0.0], np.cumsum(values)])
+    upper = np.arange(1, len(values) + 1)
+    lower = np.maximum(upper - window, 0)
+    return (totals[upper] - totals[lower]) / (upper - lower)
+
+
+def balance_series(
+    days: List,
+    income: List[int],
+    expense: List[int],
+    granularity: str = "month",
+    opening: int = 0,
+    window: Optional[int] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """Bucket daily totals and compute the running balance, all in cents.
+
+    Every bucket from start (or the first active day) to end (or the last
+    active day) gets a point, including buckets without transactions.
+    Returns (labels, income, expense, balance, rolling average of the
+    balance over `window` buckets or None).
+    """
+    days = np.asarray(days, dtype="datetime64[D]")
+    if start is None and len(days):
+        start = days.min()
+    if end is None and len(days):
+        end = days.max()
+    if start is None or end is None or np.datetime64(start, "D") > np.datetime64(end, "D"):
+        empty = np.zeros(0)
+        return [], empty, empty, empty, (empty if window else None)
+
+    first = bucket_starts(np.asarray([start], dtype="datetime64[D]"), granularity)[0]
+    last = bucket_starts(np.asarray([end], dtype="datetime64[D]"), granularity)[0]
+    buckets = int(bucket_positions(np.asarray([last]), first, granularity)[0]) + 1
+    if granularity == "month":
+        labels = (first.astype("datetime64[M]") + np.arange(buckets)).astype(str).tolist()
+    else:
+        labels = (first + np.arange(buckets) * (7 if granularity == "week" else 1)).astype(str).tolist()
+
+    positions = bucket_positions(bucket_starts(days, granularity), first, granularity)
+    inside = (positions >= 0) & (positions < buckets)
+    income_buckets = np.bincount(positions[inside], weights=np.asarray(income, dtype=np.float64)[inside], minlength=buckets)
+    expense_buckets = np.bincount(positions[inside], weights=np.asarray(expense, dtype=np.float64)[inside], minlength=buckets)
+    balance = opening + np.cumsum(income_buckets - expense_buckets)
+    average = rolling_mean(balance, window) if window else None
+    return labels, income_buckets, expense_buckets, balance, average
@@ -0,0 +1,77 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+# A budget caps one category's expenses per calendar month. Spend is never
+# aggregated from the ledger: monthly_rollups already holds each
+# (ledger, month, category, type) total, kept current on every write, so a
+# month's status costs one indexed read per budget.
+#
+# budget_alerts records each threshold a budget crosses, once per month.
+# Writes that add expenses re-check the budgets of the categories they touched.
+
+DEFAULT_ALERT_THRESHOLDS = [80, 100]
+
+
+async def month_spend(collection, ledger: str, month: str, categories: Iterable[str]) -> Dict[str, int]:
+    """Expense cents per category for one month, read from monthly_rollups."""
+    spend = {}
+    async for rollup in collection.find(
+        {"ledger_id": ledger, "month": month, "category": {"$in": list(categories)}, "type": "expense"},
+        {"_id": 0, "category": 1, "amount_cents": 1},
+    ):
+        spend[rollup["category"]] = rollup["amount_cents"]
+    return spend
+
+
+def percent_spent(spent_cents: int, limit_cents: int) -> float:
+    return round(spent_cents * 100 / limit_cents, 1) if limit_cents else 0.0
+
+
+def crossed_thresholds(thresholds: List[int], spent_cents: int, limit_cents: int) -> List[int]:
+    return sorted(threshold for threshold in thresholds if spent_cents * 100 >= threshold * limit_cents)
+
+
+async def evaluate_budgets(db, ledger: str, month: str, categories: Optional[Iterable[str]] = None) -> int:
+    """Record an alert for every threshold the month's spend has reached; returns how many were new."""
+    query = {"ledger_id": ledger}
+    if categories is not None:
+        query["category"] = {"$in": list(categories)}
+    budgets = await db.budgets.find(query, {"_id": 0}).to_list(None)
+    if not budgets:
+        return 0
+    spend = await month_spend(db.monthly_rollups, ledger, month, [budget["category"] for budget in budgets])
+    now = datetime.utcnow()
+    operations = []
+    for budget in budgets:
+        spent = spend.get(budget["category"], 0)
+        for threshold in crossed_thresholds(budget["alert_thresholds"], spent, budget["limit_cents"]):
+            # The unique (budget, month, threshold) key makes each alert fire once, even across workers
+            operations.append(UpdateOne(
+                {"ledger_id": ledger, "budget_id": budget["id"], "month": month, "threshold": threshold},
+                {"$setOnInsert": {
+                    "category": budget["category"],
+                    "spent_cents": spent,
+                    "limit_cents": budget["limit_cents"],
+                    "created_at": now,
+                }},
+                upsert=True,
+            ))
+    if not operations:
+        return 0
+    result = await db.budget_alerts.bulk_write(operations, ordered=False)
+    return result.upserted_count
+
+
+async def check_budget_alerts(db, added: Iterable[dict] = ()) -> int:
+    """Re-check the budgets of every (ledger, month, category) that stored rows added expenses to."""
+    touched = defaultdict(set)
+    for transaction in added:
+        if transaction["type"] == "expense":
+            touched[(transaction["ledger_id"], transaction["date"].strftime("%Y-%m"))].add(transaction["category"])
+    alerts = 0
+    for (ledger, month), categories in touched.items():
+        alerts += await evaluate_budgets(db, ledger, month, categories)
+    return alerts
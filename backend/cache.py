@@ -0,0 +1,107 @@
+"""Response cache for analytics routes.
+
+Cached entries are keyed on the request plus a version number per data
+scope ("transactions", "recurring"). Write handlers bump the version of
+the scope they touch. That invalidates exactly the entries that depend on
+it without scanning the cache, and the same versions double as ETags.
+
+MemoryCache is per process. With several workers, set ANALYTICS_CACHE_URL
+to a redis:// URL so entries and versions are shared between them.
+Each version tag carries an epoch, like MemoryCache.instance, so counters
+that restart after a Redis flush or eviction never reissue an earlier tag.
+"""
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class CacheBackend:
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        raise NotImplementedError
+
+    async def version(self, scope: str) -> Tuple[str, float]:
+        """Current (version tag, last modified timestamp) for a data scope."""
+        raise NotImplementedError
+
+    async def bump(self, scope: str):
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.versions = {}
+        # Version tags are unique to this process so another worker's ETag never matches ours
+        self.instance = uuid.uuid4().hex[:8]
+        self.started = time.time()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        self.entries[key] = (value, time.monotonic() + ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def version(self, scope: str) -> Tuple[str, float]:
+        number, modified = self.versions.get(scope, (0, self.started))
+        return f"{self.instance}.{number}", modified
+
+    async def bump(self, scope: str):
+        number, _ = self.versions.get(scope, (0, self.started))
+        self.versions[scope] = (number + 1, time.time())
+
+
+class RedisCache(CacheBackend):
+    def __init__(self, url: str, prefix: str = "budget:analytics:"):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.redis.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        await self.redis.set(self.prefix + key, value, ex=ttl)
+
+    async def version(self, scope: str) -> Tuple[str, float]:
+        key = self.prefix + "version:" + scope
+        epoch, number, modified = await self.redis.hmget(key, "epoch", "number", "modified")
+        if epoch is None:
+            # A missing hash (first use, flush or eviction) starts a new epoch dated now,
+            # so neither an earlier ETag nor an earlier If-Modified-Since can match
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hsetnx(key, "epoch", uuid.uuid4().hex[:8])
+                pipe.hsetnx(key, "modified", time.time())
+                pipe.hmget(key, "epoch", "number", "modified")
+                *_, (epoch, number, modified) = await pipe.execute()
+        return f"{epoch.decode()}.{(number or b'0').decode()}", float(modified)
+
+    async def bump(self, scope: str):
+        key = self.prefix + "version:" + scope
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hsetnx(key, "epoch", uuid.uuid4().hex[:8])
+            pipe.hincrby(key, "number", 1)
+            pipe.hset(key, "modified", time.time())
+            await pipe.execute()
+
+
+def create_cache(url: Optional[str]) -> CacheBackend:
+    if url:
+        return RedisCache(url)
+    return MemoryCache()
@@ -0,0 +1,270 @@
+"""Automatic categorization of transactions from their descriptions.
+
+A multinomial naive Bayes model per ledger and transaction type, trained on
+the `search_terms` of every categorized row. Its counts live in the
+category_terms collection, one document per (ledger, type, category, term)
+plus a row count per category under PRIOR_TERM. ledger_changed pushes $inc
+deltas there on every write, like the monthly rollups, so the model trains
+incrementally and survives restarts without a retraining pass.
+
+Each process keeps the counts of recently used ledgers in memory. It applies
+its own deltas to them directly and reloads them from MongoDB every
+MODEL_TTL seconds to pick up other workers' writes. The scoring arrays are
+rebuilt from the counts at most every REBUILD_INTERVAL seconds, so a bulk
+import is categorized in vectorized batches against a model that is at most
+that far behind. NumPy is imported only when a model is first scored.
+
+Rows in DEFAULT_CATEGORY are what gets categorized. Rows the model
+categorized are marked `auto_categorized` until someone sets their category,
+and neither kind trains the model, so it never learns from its own guesses.
+"""
+import logging
+import math
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from pymongo import UpdateOne
+
+from storage import DEFAULT_CATEGORY
+
+logger = logging.getLogger(__name__)
+
+PRIOR_TERM = ""  # never a search term, so it can carry the per-category row count
+SMOOTHING = 1.0
+MIN_CONFIDENCE = 0.6
+# A type needs this many categorized rows before its predictions are assigned
+MIN_TRAINING_ROWS = 10
+MODEL_TTL = 300
+REBUILD_INTERVAL = 5
+MAX_CACHED_MODELS = 64
+
+
+def trains(transaction: dict) -> bool:
+    # Rows without search_terms are skipped both ways (see storage.py)
+    return (
+        transaction.get("category") != DEFAULT_CATEGORY
+        and not transaction.get("auto_categorized")
+        and "search_terms" in transaction
+    )
+
+
+def count_deltas(removed: Iterable[dict] = (), added: Iterable[dict] = ()) -> dict:
+    """Net change per (ledger, type, category, term) for stored rows leaving and entering the ledger."""
+    deltas = defaultdict(int)
+    for sign, transactions in ((-1, removed), (1, added)):
+        for transaction in transactions:
+            if not trains(transaction):
+                continue
+            key = (transaction["ledger_id"], transaction["type"], transaction["category"])
+            for term in (PRIOR_TERM, *transaction["search_terms"]):
+                deltas[(*key, term)] += sign
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+class CategoryModel:
+    """Term counts of one ledger and the naive Bayes arrays scored from them."""
+
+    def __init__(self, counts: Dict[tuple, int]):
+        self.counts = counts  # {(type, category, term): rows}
+        self.loaded_at = time.monotonic()
+        self.built_at = None
+        self.dirty = True
+        self.types = {}
+
+    def apply(self, deltas: Dict[tuple, int]):
+        for key, delta in deltas.items():
+            count = self.counts.get(key, 0) + delta
+            if count > 0:
+                self.counts[key] = count
+            else:
+                self.counts.pop(key, None)
+        self.dirty = True
+
+    def refresh(self):
+        if not self.dirty:
+            return
+        if self.built_at is not None and time.monotonic() - self.built_at < REBUILD_INTERVAL:
+            return
+        import numpy as np
+
+        grouped = defaultdict(list)
+        for (type_, category, term), count in self.counts.items():
+            grouped[type_].append((category, term, count))
+        self.types = {}
+        for type_, entries in grouped.items():
+            rows = {category: count for category, term, count in entries if term == PRIOR_TERM}
+            categories = sorted(rows)
+            if sum(rows.values()) < MIN_TRAINING_ROWS:
+                continue
+            category_index = {category: index for index, category in enumerate(categories)}
+            terms = sorted({term for _, term, _ in entries if term != PRIOR_TERM})
+            term_index = {term: index for index, term in enumerate(terms)}
+            matrix = np.zeros((len(terms), len(categories)), dtype=np.float64)
+            for category, term, count in entries:
+                if term != PRIOR_TERM and category in category_index:
+                    matrix[term_index[term], category_index[category]] = count
+            priors = np.array([rows[category] for category in categories], dtype=np.float64)
+            # Laplace-smoothed log P(term | category) and log P(category)
+            totals = matrix.sum(axis=0) + SMOOTHING * len(terms)
+            self.types[type_] = (
+                categories,
+                term_index,
+                np.log(priors) - math.log(priors.sum()),
+                (np.log(matrix + SMOOTHING) - np.log(totals)).astype(np.float32),
+            )
+        self.built_at = time.monotonic()
+        self.dirty = False
+
+    def predict(self, type_: str, rows: Sequence[Sequence[str]], limit: int = 1) -> List[List[Tuple[str, float]]]:
+        """Top categories with their probability for each row's terms; [] when no term is known."""
+        self.refresh()
+        if type_ not in self.types or not rows:
+            return [[] for _ in rows]
+        import numpy as np
+
+        categories, term_index, log_prior, log_likelihood = self.types[type_]
+        positions, term_ids = [], []
+        for position, terms in enumerate(rows):
+            for term in terms:
+                term_id = term_index.get(term)
+                if term_id is not None:
+                    positions.append(position)
+                    term_ids.append(term_id)
+        positions = np.asarray(positions, dtype=np.int64)
+        scores = np.tile(log_prior, (len(rows), 1))
+        np.add.at(scores, positions, log_likelihood[np.asarray(term_ids, dtype=np.int64)])
+        scores -= scores.max(axis=1, keepdims=True)
+        probabilities = np.exp(scores)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        known = np.bincount(positions, minlength=len(rows)) > 0
+
+        limit = min(limit, len(categories))
+        best = np.argsort(-probabilities, axis=1)[:, :limit]
+        return [
+            [(categories[index], float(probabilities[position, index])) for index in best[position]]
+            if known[position] else []
+            for position in range(len(rows))
+        ]
+
+
+class Categorizer:
+    """Per-process cache of ledger models over the persisted category_terms counts."""
+
+    def __init__(self):
+        self.models = OrderedDict()
+
+    async def model(self, db, ledger: str) -> CategoryModel:
+        model = self.models.get(ledger)
+        if model is None or time.monotonic() - model.loaded_at > MODEL_TTL:
+            counts = {}
+            async for document in db.category_terms.find({"ledger_id": ledger}, {"_id": 0, "ledger_id": 0}):
+                counts[(document["type"], document["category"], document["term"])] = document["count"]
+            model = self.models[ledger] = CategoryModel(counts)
+        self.models.move_to_end(ledger)
+        while len(self.models) > MAX_CACHED_MODELS:
+            self.models.popitem(last=False)
+        return model
+
+    async def learn(self, db, removed: Iterable[dict] = (), added: Iterable[dict] = ()):
+        """Persist the count changes of a write and apply them to the cached models."""
+        deltas = count_deltas(removed, added)
+        if not deltas:
+            return
+        await db.category_terms.bulk_write(
+            [
+                UpdateOne(
+                    {"ledger_id": ledger, "type": type_, "category": category, "term": term},
+                    {"$inc": {"count": count}},
+                    upsert=True,
+                )
+                for (ledger, type_, category, term), count in deltas.items()
+            ],
+            ordered=False,
+        )
+        per_ledger = defaultdict(dict)
+        for (ledger, *key), count in deltas.items():
+            per_ledger[ledger][tuple(key)] = count
+        for ledger, ledger_deltas in per_ledger.items():
+            if ledger in self.models:
+                self.models[ledger].apply(ledger_deltas)
+        # Keys whose count reached zero carry no information; dropping them keeps loads small
+        emptied = defaultdict(list)
+        for (ledger, type_, category, term), count in deltas.items():
+            if count < 0:
+                emptied[(ledger, type_, category)].append(term)
+        for (ledger, type_, category), terms in emptied.items():
+            await db.category_terms.delete_many(
+                {"ledger_id": ledger, "type": type_, "category": category, "term": {"$in": terms}, "count": {"$lte": 0}}
+            )
+
+    async def assign(self, db, ledger: str, documents: List[dict]) -> int:
+        """Set the category of stored documents in DEFAULT_CATEGORY when the model is confident."""
+        pending = defaultdict(list)
+        for document in documents:
+            if document.get("category") == DEFAULT_CATEGORY:
+                pending[document["type"]].append(document)
+        if not pending:
+            return 0
+        model = await self.model(db, ledger)
+        assigned = 0
+        for type_, batch in pending.items():
+            predictions = model.predict(type_, [document["search_terms"] for document in batch])
+            for document, prediction in zip(batch, predictions):
+                if prediction and prediction[0][1] >= MIN_CONFIDENCE:
+                    document["category"] = prediction[0][0]
+                    document["auto_categorized"] = True
+                    assigned += 1
+        return assigned
+
+    async def suggest(self, db, ledger: str, type_: str, terms: Sequence[str], limit: int) -> List[Tuple[str, float]]:
+        model = await self.model(db, ledger)
+        return model.predict(type_, [terms], limit)[0]
+
+
+async def rebuild_category_terms(db):
+    """Recount category_terms from the categorized rows of the ledger with a single $merge aggregation."""
+    await db.category_terms.delete_many({})
+    pipeline = [
+        {"$match": {
+            "category": {"$ne": DEFAULT_CATEGORY},
+            "auto_categorized": {"$ne": True},
+            "search_terms": {"$exists": True},
+        }},
+        {"$project": {
+            "ledger_id": 1,
+            "type": 1,
+            "category": 1,
+            "term": {"$concatArrays": [[PRIOR_TERM], "$search_terms"]},
+        }},
+        {"$unwind": "$term"},
+        {"$group": {
+            "_id": {"ledger_id": "$ledger_id", "type": "$type", "category": "$category", "term": "$term"},
+            "count": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0,
+            "ledger_id": "$_id.ledger_id",
+            "type": "$_id.type",
+            "category": "$_id.category",
+            "term": "$_id.term",
+            "count": 1,
+        }},
+        {"$merge": {
+            "into": "category_terms",
+            "on": ["ledger_id", "type", "category", "term"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]
+    await db.transactions.aggregate(pipeline, allowDiskUse=True).to_list(None)
+
+
+async def ensure_category_terms(db):
+    # Train once from ledgers written before the categorizer existed
+    if await db.category_terms.estimated_document_count():
+        return
+    if not await db.transactions.estimated_document_count():
+        return
+    logger.info("Training the categorizer from existing transactions")
+    await rebuild_category_terms(db)
@@ -0,0 +1,73 @@
+"""MongoDB client configuration and lifecycle.
+
+Pool size, timeouts and the analytics read preference come from the
+environment, so each deployment can size them. Every worker process holds
+one pool, which means a deployment opens at most workers x MONGO_MAX_POOL_SIZE
+connections.
+
+Motor does not connect when the client is constructed. The app's lifespan
+handler calls warm_up() before serving, so the first requests do not pay
+for server selection and connection setup. It calls close() on shutdown.
+
+Analytics reads go through `Database.analytics`, which carries
+MONGO_ANALYTICS_READ_PREFERENCE. Setting it to a secondary mode offloads
+dashboard aggregations from the primary. A response computed right after a
+write may then miss that write, for up to the analytics cache TTL.
+"""
+import asyncio
+import logging
+import os
+from typing import Sequence
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReadPreference
+
+logger = logging.getLogger(__name__)
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+def client_options() -> dict:
+    options = {
+        "appname": "budget-planner",
+        "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", "50")),
+        "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", "5")),
+        "maxIdleTimeMS": int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", "300000")),
+        "serverSelectionTimeoutMS": int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+        "connectTimeoutMS": int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+    }
+    # Unset means no socket timeout, so long exports and migrations are never cut off
+    if os.environ.get("MONGO_SOCKET_TIMEOUT_MS"):
+        options["socketTimeoutMS"] = int(os.environ["MONGO_SOCKET_TIMEOUT_MS"])
+    return options
+
+
+def analytics_read_preference():
+    name = os.environ.get("MONGO_ANALYTICS_READ_PREFERENCE", "primary")
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"MONGO_ANALYTICS_READ_PREFERENCE must be one of {', '.join(READ_PREFERENCES)}")
+    return READ_PREFERENCES[name]
+
+
+class Database:
+    def __init__(self, url: str, name: str, event_listeners: Sequence = ()):
+        self.options = client_options()
+        self.client = AsyncIOMotorClient(url, event_listeners=list(event_listeners), **self.options)
+        self.db = self.client[name]
+        self.analytics = self.client.get_database(name, read_preference=analytics_read_preference())
+
+    async def warm_up(self):
+        """Select a server and open minPoolSize connections before traffic arrives."""
+        # Concurrent pings each check out their own connection, so the pool grows to match
+        connections = max(1, min(self.options["minPoolSize"], self.options["maxPoolSize"]))
+        await asyncio.gather(*(self.db.command("ping") for _ in range(connections)))
+        logger.info("MongoDB connection pool warmed up with %d connections", connections)
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,231 @@
+"""Columnar export of a ledger's transactions to Parquet or Arrow IPC files.
+
+Rows are read from a date-ordered cursor and written EXPORT_BATCH_SIZE at a
+time, one Parquet row group or Arrow record batch per batch. Memory is
+bounded by the batch size rather than the ledger size. Because the cursor is
+date-ordered, a partitioned export has only one month's (or year's) file
+open at a time. Partitions use the Hive layout (`month=2025-01/`), which
+pandas, pyarrow.dataset and DuckDB discover on their own.
+
+Arrow IPC files can be memory-mapped by readers. Parquet is smaller on disk.
+"""
+import os
+from collections import defaultdict
+from datetime import date, datetime
+from pathlib import Path
+from typing import AsyncIterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from metrics import record_returned
+from storage import DEFAULT_LEDGER, from_cents, to_cents
+
+EXPORT_BATCH_SIZE = 10000
+EXPORT_FORMATS = {
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrow", "application/vnd.apache.arrow.file"),
+}
+PARTITIONS = {"month": 7, "year": 4}  # length of the ISO date prefix naming each partition
+EXPORT_PROJECTION = {
+    "_id": 0, "id": 1, "ledger_id": 1, "date": 1, "type": 1, "category": 1,
+    "amount_cents": 1, "amount": 1, "description": 1, "created_at": 1, "updated_at": 1,
+}
+
+SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("ledger_id", pa.dictionary(pa.int32(), pa.string())),
+    ("date", pa.date32()),
+    ("type", pa.dictionary(pa.int32(), pa.string())),
+    ("category", pa.dictionary(pa.int32(), pa.string())),
+    # Exact cents for sums, and the float amount the API uses
+    ("amount_cents", pa.int64()),
+    ("amount", pa.float64()),
+    ("description", pa.string()),
+    ("created_at", pa.timestamp("ms")),
+    ("updated_at", pa.timestamp("ms")),
+])
+# An IPC file allows one dictionary per field for the whole file, but each batch builds its own,
+# so Arrow output keeps those columns as plain strings
+PLAIN_SCHEMA = pa.schema([
+    pa.field(field.name, field.type.value_type) if pa.types.is_dictionary(field.type) else field
+    for field in SCHEMA
+])
+
+
+def stored_day(value) -> date:
+    # Rows not yet migrated keep the legacy ISO string, which pyarrow will not cast to date32
+    return value.date() if isinstance(value, datetime) else date.fromisoformat(value)
+
+
+def record_batch(transactions: List[dict], schema: pa.Schema = SCHEMA) -> pa.RecordBatch:
+    cents = [
+        transaction["amount_cents"] if "amount_cents" in transaction else to_cents(transaction["amount"])
+        for transaction in transactions
+    ]
+    columns = {
+        "id": [transaction["id"] for transaction in transactions],
+        "ledger_id": [transaction.get("ledger_id", DEFAULT_LEDGER) for transaction in transactions],
+        "date": [stored_day(transaction["date"]) for transaction in transactions],
+        "type": [transaction["type"] for transaction in transactions],
+        "category": [transaction["category"] for transaction in transactions],
+        "amount_cents": cents,
+        "amount": [from_cents(amount) for amount in cents],
+        "description": [transaction.get("description", "") for transaction in transactions],
+        "created_at": [transaction.get("created_at") for transaction in transactions],
+        "updated_at": [transaction.get("updated_at") for transaction in transactions],
+    }
+    arrays = [
+        pa.array(columns[field.name], type=field.type.value_type).dictionary_encode()
+        if pa.types.is_dictionary(field.type) else pa.array(columns[field.name], type=field.type)
+        for field in schema
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def partition_of(transaction: dict, partition: str) -> str:
+    day = transaction["date"]
+    return (day.strftime("%Y-%m-%d") if hasattr(day, "strftime") else str(day))[:PARTITIONS[partition]]
+
+
+class BatchWriter:
+    """One output file written batch by batch in either format."""
+
+    def __init__(self, sink, fmt: str):
+        if fmt == "parquet":
+            self.schema = SCHEMA
+            self.writer = pq.ParquetWriter(sink, self.schema, compression="zstd")
+        else:
+            self.schema = PLAIN_SCHEMA
+            self.writer = ipc.new_file(sink, self.schema)
+        self.fmt = fmt
+
+    def write(self, transactions: List[dict]):
+        batch = record_batch(transactions, self.schema)
+        if self.fmt == "parquet":
+            self.writer.write_batch(batch, row_group_size=batch.num_rows)
+        else:
+            self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+
+
+class ChunkSink:
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+async def batches(cursor, size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[List[dict]]:
+    batch = []
+    async for transaction in cursor.batch_size(size):
+        batch.append(transaction)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def stream_export(cursor, fmt: str) -> AsyncIterator[bytes]:
+    """Encode a date-ordered cursor as one Parquet or Arrow file, yielding bytes as each batch is written."""
+    sink = ChunkSink()
+    writer = BatchWriter(pa.PythonFile(sink, mode="w"), fmt)
+    count = 0
+    try:
+        async for batch in batches(cursor):
+            writer.write(batch)
+            count += len(batch)
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+    finally:
+        record_returned(count)
+
+
+async def write_export(cursor, path: Path, fmt: str, partition: Optional[str] = None) -> dict:
+    """Write a date-ordered cursor to `path`, or to one file per partition under it."""
+    extension = EXPORT_FORMATS[fmt][0]
+    rows, files = 0, []
+    writer, current = None, None
+    # BSON sorts legacy string dates before real ones, so a partition can come round twice;
+    # numbering its parts keeps the second pass from overwriting the first
+    parts = defaultdict(int)
+    try:
+        async for batch in batches(cursor):
+            # Split each batch where the partition changes; the cursor order keeps partitions contiguous
+            start = 0
+            while start < len(batch):
+                key = partition_of(batch[start], partition) if partition else None
+                end = start + 1
+                while end < len(batch) and partition and partition_of(batch[end], partition) == key:
+                    end += 1
+                if not partition:
+                    end = len(batch)
+                if writer is None or key != current:
+                    if writer is not None:
+                        writer.close()
+                    target = path / f"{partition}={key}" / f"part-{parts[key]}{extension}" if partition else path
+                    parts[key] += 1
+                    os.makedirs(target.parent, exist_ok=True)
+                    writer, current = BatchWriter(str(target), fmt), key
+                    files.append(str(target))
+                writer.write(batch[start:end])
+                rows += end - start
+                start = end
+    finally:
+        if writer is not None:
+            writer.close()
+    return {"rows": rows, "files": files}
+
+
+def main(
+    path: Path,
+    format: str = "parquet",
+    partition: Optional[str] = None,
+    ledger: str = DEFAULT_LEDGER,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+):
+    """Export a ledger's transactions to a Parquet or Arrow file, or a directory partitioned by month or year."""
+    import asyncio
+    from server import analytics_db, in_ledger, transaction_filter
+
+    if format not in EXPORT_FORMATS:
+        raise SystemExit(f"Format must be one of {', '.join(EXPORT_FORMATS)}")
+    if partition and partition not in PARTITIONS:
+        raise SystemExit(f"Partition must be one of {', '.join(PARTITIONS)}")
+    filters = transaction_filter(start_date, end_date, None, [], None, None)
+    cursor = analytics_db.transactions.find(in_ledger(ledger, filters), EXPORT_PROJECTION) \
+        .sort([("date", 1), ("id", 1)])
+    result = asyncio.run(write_export(cursor, path, format, partition))
+    print(f"Exported {result['rows']} transactions to {len(result['files'])} files")
+
+
+if __name__ == "__main__":
+    import typer
+
+    typer.run(main)
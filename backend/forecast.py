@@ -0,0 +1,53 @@
+from datetime import date, timedelta
+from typing import List, Tuple
+
+import numpy as np
+
+from recurrence import occurrences_between
+from storage import to_cents
+
+
+def project_balance(
+    start_cents: int,
+    templates: List[dict],
+    anchors: List[str],
+    today: date,
+    horizon_days: int,
+    granularity: str = "day",
+) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Project a running balance from today to today + horizon_days.
+
+    Returns (bucket labels, net change per bucket, closing balance per bucket), all in
+integer cents so that sums stay exact.
+    Occurrences already due but not yet posted land in the first bucket.
+    """
+    end = today + timedelta(days=horizon_days)
+    today_day = np.datetime64(today, "D")
+    if granularity == "month":
+        first_bucket = today_day.astype("datetime64[M]")
+        buckets = int((np.datetime64(end, "M") - first_bucket).astype(np.int64)) + 1
+        labels = (first_bucket + np.arange(buckets)).astype(str).tolist()
+    else:
+        buckets = horizon_days + 1
+        labels = (today_day + np.arange(buckets)).astype(str).tolist()
+
+    changes = np.zeros(buckets, dtype=np.int64)
+    if templates:
+        signed = np.array([
+            to_cents(template["amount"]) if template["type"] == "income" else -to_cents(template["amount"])
+            for template in templates
+        ], dtype=np.int64)
+        indexes, days = occurrences_between(
+            anchors,
+            [template["frequency"] for template in templates],
+            [template["nextDate"] for template in templates],
+            end,
+        )
+        if granularity == "month":
+            positions = (days.astype("datetime64[M]") - first_bucket).astype(np.int64)
+        else:
+            positions = (days - today_day).astype(np.int64)
+        # bincount weights are floats; add.at keeps the cents integral
+        np.add.at(changes, np.maximum(positions, 0), signed[indexes])
+
+    return labels, changes, start_cents + np.cumsum(changes)
@@ -0,0 +1,243 @@
+import csv
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from storage import DEFAULT_CATEGORY, DEFAULT_LEDGER
+
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%d.%m.%Y", "%Y%m%d")
+DECIMAL_SEPARATORS = (".", ",")
+OFX_CHUNK_SIZE = 64 * 1024
+
+# Header names recognised for each field, compared case-insensitively
+COLUMN_ALIASES = {
+    "date": ("date", "transaction date", "posted date", "posting date", "booking date"),
+    "amount": ("amount", "transaction amount", "value"),
+    "debit": ("debit", "withdrawal", "money out"),
+    "credit": ("credit", "deposit", "money in"),
+    "description": ("description", "memo", "payee", "name", "details"),
+    "category": ("category",),
+    "type": ("type", "transaction type"),
+}
+
+
+def detect_format(filename: str) -> str:
+    return "ofx" if Path(filename).suffix.lower() in (".ofx", ".qfx") else "csv"
+
+
+def parse_column_overrides(pairs: List[str]) -> Dict[str, str]:
+    """Turn ["amount=Betrag", ...] into {"amount": "Betrag"}."""
+    overrides = {}
+    for pair in pairs:
+        field, sep, header = pair.partition("=")
+        if not sep or field.strip() not in COLUMN_ALIASES:
+            raise ValueError(f"Invalid column mapping: {pair!r}")
+        overrides[field.strip()] = header.strip()
+    return overrides
+
+
+def parse_amount(value, decimal_separator: Optional[str] = None) -> Optional[float]:
+    """Parse a statement amount such as "-1,234.56", "1.234,56" or "(12.50)".
+
+    Without a decimal_separator, the last of "," and "." in the text is the
+    decimal mark when both appear, and a mark repeated in the integer part
+    groups thousands. A single mark followed by exactly three digits
+    ("1,234") could be either, so it is left unparsed (None) and the row is
+    reported instead of guessed.
+    """
+    if value is None:
+        return None
+    text = str(value).strip()
+    negative = text.startswith("(") and text.endswith(")")
+    text = re.sub(r"[^0-9.,\-]", "", text)
+    marks = [mark for mark in DECIMAL_SEPARATORS if mark in text]
+    if decimal_separator is None:
+        if len(marks) == 2:
+            decimal_separator = max(marks, key=text.rindex)
+        elif marks and text.count(marks[0]) == 1:
+            if re.search(re.escape(marks[0]) + r"\d{3}$", text):
+                return None
+            decimal_separator = marks[0]
+        else:
+            decimal_separator = "," if marks == ["."] else "."
+    grouping = "," if decimal_separator == "." else "."
+    integer, _, fraction = text.partition(decimal_separator)
+    if not re.fullmatch(r"-?(\d+|\d{1,3}(" + re.escape(grouping) + r"\d{3})+)", integer) \
+            or not re.fullmatch(r"\d*", fraction):
+        return None
+    amount = float(integer.replace(grouping, "") + "." + (fraction or "0"))
+    return -abs(amount) if negative else amount
+
+
+def parse_date(value, date_format: Optional[str] = None) -> Optional[str]:
+    text = (value or "").strip()
+    for fmt in (date_format,) if date_format else DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def normalize_row(date, amount, description, category=None, type_=None, date_format=None, decimal_separator=None) -> dict:
+    """Map raw statement values onto the TransactionCreate shape.
+
+    Values that cannot be parsed are left as None so validation reports
+    them per row instead of the importer guessing.
+    """
+    value = amount if isinstance(amount, float) else parse_amount(amount, decimal_separator)
+    type_ = (type_ or "").strip().lower() or None
+    if type_ not in ("income", "expense"):
+        type_ = None if value is None else ("expense" if value < 0 else "income")
+    return {
+        "type": type_,
+        "category": (category or "").strip() or DEFAULT_CATEGORY,
+        "amount": abs(value) if value is not None else None,
+        "description": (description or "").strip(),
+        "date": parse_date(date, date_format),
+    }
+
+
+def fingerprint(transaction: dict) -> tuple:
+    """Key used to recognise a statement line that is already in the ledger (stored form)."""
+    return (
+        transaction["date"],
+        transaction["amount_cents"],
+        transaction["description"].strip().lower(),
+    )
+
+
+def resolve_columns(headers: List[str], overrides: Dict[str, str]) -> Dict[str, str]:
+    lookup = {header.strip().lower(): header for header in headers}
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        if field in overrides:
+            if overrides[field] not in headers:
+                raise ValueError(f"Column {overrides[field]!r} not found in CSV header")
+            columns[field] = overrides[field]
+            continue
+        for alias in aliases:
+            if alias in lookup:
+                columns[field] = lookup[alias]
+                break
+    if "date" not in columns or "description" not in columns:
+        raise ValueError("CSV must have date and description columns")
+    if "amount" not in columns and not ("debit" in columns or "credit" in columns):
+        raise ValueError("CSV must have an amount column or debit/credit columns")
+    return columns
+
+
+def read_csv(
+    stream,
+    overrides: Optional[Dict[str, str]] = None,
+    date_format: Optional[str] = None,
+    decimal_separator: Optional[str] = None,
+) -> Iterator[dict]:
+    # The header is resolved eagerly so a bad mapping fails before any row is read
+    reader = csv.DictReader(stream)
+    columns = resolve_columns(reader.fieldnames or [], overrides or {})
+
+    def rows():
+        for record in reader:
+            if "amount" in columns:
+                amount = record.get(columns["amount"])
+            else:
+                # A blank side counts as 0; an unparseable one leaves the row's amount unset
+                sides = [
+                    (record.get(columns[side]) or "").strip() if side in columns else ""
+                    for side in ("credit", "debit")
+                ]
+                credit, debit = (parse_amount(text, decimal_separator) if text else 0.0 for text in sides)
+                amount = None if credit is None or debit is None else float(credit - abs(debit))
+            yield normalize_row(
+                record.get(columns["date"]),
+                amount,
+                record.get(columns["description"]),
+                record.get(columns["category"]) if "category" in columns else None,
+                record.get(columns["type"]) if "type" in columns else None,
+                date_format,
+                decimal_separator,
+            )
+    return rows()
+
+
+def read_ofx(stream) -> Iterator[dict]:
+    """Yield STMTTRN records from an OFX/QFX file.
+
+    Both SGML (unclosed tags) and XML variants are handled by splitting on
+    "<" as chunks arrive, so only the current record is ever held in memory.
+    """
+    record = None
+    buffer = ""
+    while True:
+        chunk = stream.read(OFX_CHUNK_SIZE)
+        if chunk:
+            buffer += chunk
+            *tokens, buffer = buffer.split("<")
+        else:
+            tokens, buffer = [buffer], ""
+        for token in tokens:
+            tag, _, value = token.partition(">")
+            tag = tag.strip().upper()
+            if tag == "STMTTRN":
+                record = {}
+            elif tag == "/STMTTRN" and record is not None:
+                yield normalize_row(
+                    (record.get("DTPOSTED") or "")[:8],
+                    record.get("TRNAMT"),
+                    record.get("NAME") or record.get("MEMO"),
+                    date_format="%Y%m%d",
+                )
+                record = None
+            elif record is not None and tag and not tag.startswith("/"):
+                record[tag] = value.strip()
+        if not chunk:
+            return
+
+
+def read_statement(
+    stream,
+    fmt: str,
+    overrides: Optional[Dict[str, str]] = None,
+    date_format: Optional[str] = None,
+    decimal_separator: Optional[str] = None,
+) -> Iterator[dict]:
+    if decimal_separator not in (None, *DECIMAL_SEPARATORS):
+        raise ValueError(f"Decimal separator must be one of {' '.join(DECIMAL_SEPARATORS)}")
+    if fmt == "ofx":
+        return read_ofx(stream)
+    if fmt == "csv":
+        return read_csv(stream, overrides, date_format, decimal_separator)
+    raise ValueError(f"Unsupported statement format: {fmt!r}")
+
+
+def main(
+    path: Path,
+    format: Optional[str] = None,
+    column: Optional[List[str]] = None,
+    date_format: Optional[str] = None,
+    decimal_separator: Optional[str] = None,
+    ledger: str = DEFAULT_LEDGER,
+):
+    """Import a CSV or OFX bank statement into a ledger's transactions."""
+    import asyncio
+    from server import ingest_rows, iterate
+
+    rows = read_statement(
+        path.open(newline="", encoding="utf-8-sig"),
+        format or detect_format(path.name),
+        parse_column_overrides(column or []),
+        date_format,
+        decimal_separator,
+    )
+    result = asyncio.run(ingest_rows(iterate(rows), skip_duplicates=True, ledger=ledger))
+    print(f"Inserted {result.inserted}, skipped {result.duplicates} duplicates, {len(result.errors)} errors")
+    for error in result.errors:
+        print(f"  row {error.index}: {error.error}")
+
+
+if __name__ == "__main__":
+    import typer
+
+    typer.run(main)
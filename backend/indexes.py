@@ -0,0 +1,130 @@
+import logging
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Index layout per collection. Names are fixed so drift can be detected across deploys.
+# Per-ledger indexes lead with ledger_id, so a query for one ledger only walks that
+# ledger's keys. Every unique index is prefixed by ledger_id, which keeps the
+# collections shardable on a ledger_id-led key (e.g. {ledger_id: 1, id: 1}).
+INDEXES = {
+    "transactions": [
+        IndexModel([("ledger_id", ASCENDING), ("id", ASCENDING)], name="ledger_id_unique", unique=True),
+        IndexModel([("ledger_id", ASCENDING), ("date", ASCENDING), ("id", ASCENDING)], name="ledger_date_id"),
+        IndexModel([("ledger_id", ASCENDING), ("date", ASCENDING), ("type", ASCENDING)], name="ledger_date_type"),
+        IndexModel(
+            [("ledger_id", ASCENDING), ("category", ASCENDING), ("type", ASCENDING)],
+            name="ledger_category_type",
+        ),
+        # Multikey; serves the expanded terms of /transactions/search
+        IndexModel([("ledger_id", ASCENDING), ("search_terms", ASCENDING)], name="ledger_search_terms"),
+        # Only rows claimed by a bulk update or delete in flight carry bulk_op
+        IndexModel(
+            [("bulk_op", ASCENDING)],
+            name="bulk_op",
+            partialFilterExpression={"bulk_op": {"$exists": True}},
+        ),
+    ],
+    "recurring_transactions": [
+        IndexModel([("ledger_id", ASCENDING), ("id", ASCENDING)], name="ledger_id_unique", unique=True),
+        # The scheduler scans due templates across every ledger
+        IndexModel([("nextDate", ASCENDING)], name="nextDate"),
+    ],
+    "monthly_rollups": [
+        IndexModel(
+            [("ledger_id", ASCENDING), ("month", ASCENDING), ("category", ASCENDING), ("type", ASCENDING)],
+            name="ledger_month_category_type",
+            unique=True,
+        ),
+    ],
+    "category_terms": [
+        IndexModel(
+            [("ledger_id", ASCENDING), ("type", ASCENDING), ("category", ASCENDING), ("term", ASCENDING)],
+            name="ledger_type_category_term",
+            unique=True,
+        ),
+    ],
+    "budgets": [
+        IndexModel([("ledger_id", ASCENDING), ("id", ASCENDING)], name="ledger_id_unique", unique=True),
+        # One budget per category; also serves the lookups made when expenses are written
+        IndexModel([("ledger_id", ASCENDING), ("category", ASCENDING)], name="ledger_category_unique", unique=True),
+    ],
+    "budget_alerts": [
+        IndexModel(
+            [("ledger_id", ASCENDING), ("budget_id", ASCENDING), ("month", ASCENDING), ("threshold", ASCENDING)],
+            name="ledger_budget_month_threshold",
+            unique=True,
+        ),
+        IndexModel([("ledger_id", ASCENDING), ("month", ASCENDING)], name="ledger_month"),
+    ],
+    "search_vocabulary": [
+        # Serves exact lookups and the anchored-regex prefix scans
+        IndexModel([("ledger_id", ASCENDING), ("term", ASCENDING)], name="ledger_term_unique", unique=True),
+        IndexModel([("ledger_id", ASCENDING), ("variants", ASCENDING)], name="ledger_variants"),
+    ],
+}
+
+# Superseded by the ledger-led layout. The old unique rollup key would reject
+# the same month, category and type in two ledgers, so these are dropped.
+RETIRED_INDEXES = {
+    "transactions": ["id_unique", "date_id", "date_type", "category_type"],
+    "recurring_transactions": ["id_unique"],
+    "monthly_rollups": ["month_category_type"],
+}
+
+
+def index_spec(model: IndexModel) -> tuple:
+    document = model.document
+    return list(document["key"].items()), bool(document.get("unique", False))
+
+
+def existing_spec(info: dict) -> tuple:
+    return [tuple(key) for key in info["key"]], bool(info.get("unique", False))
+
+
+async def check_indexes(db) -> dict:
+    """Compare the live indexes with INDEXES and return the missing and drifted names per collection."""
+    report = {}
+    for collection_name, models in INDEXES.items():
+        existing = await db[collection_name].index_information()
+        missing, drifted = [], []
+        for model in models:
+            name = model.document["name"]
+            if name not in existing:
+                missing.append(name)
+            elif existing_spec(existing[name]) != index_spec(model):
+                drifted.append(name)
+        retired = [name for name in RETIRED_INDEXES.get(collection_name, []) if name in existing]
+        report[collection_name] = {"missing": missing, "drifted": drifted, "retired": retired}
+    return report
+
+
+async def ensure_indexes(db) -> dict:
+    """Create any missing indexes, drop retired ones and log drift.
+
+    createIndexes is a no-op for an index that already exists with the same
+    definition, so this is safe to run from every worker on every boot.
+    Drifted indexes are reported but never dropped automatically; only the
+    names listed in RETIRED_INDEXES are.
+    """
+    report = await check_indexes(db)
+    for collection_name, models in INDEXES.items():
+        status = report[collection_name]
+        for name in status["drifted"]:
+            logger.warning("Index %s.%s differs from its expected definition", collection_name, name)
+        for model in models:
+            if model.document["name"] not in status["missing"]:
+                continue
+            try:
+                await db[collection_name].create_indexes([model])
+                logger.info("Created index %s.%s", collection_name, model.document["name"])
+            except OperationFailure as exc:
+                logger.error("Could not create index %s.%s: %s", collection_name, model.document["name"], exc)
+        for name in status["retired"]:
+            try:
+                await db[collection_name].drop_index(name)
+                logger.info("Dropped retired index %s.%s", collection_name, name)
+            except OperationFailure as exc:
+                logger.error("Could not drop index %s.%s: %s", collection_name, name, exc)
+    return report
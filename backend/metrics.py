@@ -0,0 +1,289 @@
+"""Prometheus-style metrics for the API and its MongoDB traffic.
+
+MetricsMiddleware times every request and labels it with the matched route
+template, so /api/transactions/{transaction_id} is one series rather than
+one per id. Database calls are not wrapped one by one. Instead, pymongo
+command and pool listeners (see `listeners()`) observe every command the
+Motor client sends. They charge its duration and the documents it returned
+to the request that issued it. Motor runs pymongo on an executor with a
+copy of the caller's context, so the per-request stats travel through a
+ContextVar. Commands issued outside a request (startup, scheduler) are
+labelled "background".
+
+render() produces the text exposition format served at GET /metrics.
+"""
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BACKGROUND_ROUTE = "background"
+UNMATCHED_ROUTE = "unmatched"
+
+REGISTRY = []
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.append(self)
+
+    def key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def format_labels(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {value}" for name, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            items = sorted(self.values.items())
+        return [(self.name, self.format_labels(key), value) for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts plus a +Inf slot, then sum
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts = state[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[-1] += 1
+            state[1] += value
+
+    def samples(self):
+        with self.lock:
+            items = sorted((key, (list(state[0]), state[1])) for key, state in self.values.items())
+        samples = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append((f"{self.name}_bucket", self.format_labels(key, ("le", le)), cumulative))
+            samples.append((f"{self.name}_sum", self.format_labels(key), total))
+            samples.append((f"{self.name}_count", self.format_labels(key), cumulative))
+        return samples
+
+
+http_requests = Counter("http_requests_total", "HTTP requests served.", ("method", "route", "status"))
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency in seconds.", ("method", "route"),
+)
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served.")
+mongo_command_duration = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command round-trip time in seconds.", ("route", "command"),
+)
+mongo_command_failures = Counter("mongo_command_failures_total", "MongoDB commands that failed.", ("route", "command"))
+mongo_documents_read = Counter(
+    "mongo_documents_read_total", "Documents returned by MongoDB to the API, per route.", ("route",),
+)
+documents_returned = Counter(
+    "api_documents_returned_total", "Documents returned by the API to clients, per route.", ("route",),
+)
+mongo_pool_connections = Gauge(
+    "mongo_pool_connections", "Connections in the MongoDB pool, by state.", ("address", "state"),
+)
+mongo_pool_max_size = Gauge("mongo_pool_max_size", "Configured maxPoolSize of each MongoDB pool.", ("address",))
+
+
+class RequestStats:
+    """Per-request counters; filled in by listeners before the route is known."""
+
+    __slots__ = ("commands", "documents_read", "documents_returned")
+
+    def __init__(self):
+        self.commands = []
+        self.documents_read = 0
+        self.documents_returned = 0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def record_returned(count: int):
+    """Count documents handed back to the client by the current request."""
+    stats = current_request.get()
+    if stats is not None:
+        stats.documents_returned += count
+    else:
+        documents_returned.inc(count, route=BACKGROUND_ROUTE)
+
+
+def reply_documents(reply) -> int:
+    cursor = reply.get("cursor") if hasattr(reply, "get") else None
+    if not cursor:
+        return 0
+    return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+
+
+class CommandListener(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.record(event, reply_documents(event.reply))
+
+    def failed(self, event):
+        self.record(event, 0)
+        stats = current_request.get()
+        if stats is None:
+            mongo_command_failures.inc(route=BACKGROUND_ROUTE, command=event.command_name)
+        else:
+            stats.commands.append((event.command_name, None, True))
+
+    def record(self, event, documents: int):
+        seconds = event.duration_micros / 1e6
+        stats = current_request.get()
+        if stats is None:
+            mongo_command_duration.observe(seconds, route=BACKGROUND_ROUTE, command=event.command_name)
+            mongo_documents_read.inc(documents, route=BACKGROUND_ROUTE)
+            return
+        stats.commands.append((event.command_name, seconds, False))
+        stats.documents_read += documents
+
+
+class PoolListener(monitoring.ConnectionPoolListener):
+    def pool_created(self, event):
+        address = "%s:%s" % event.address
+        mongo_pool_max_size.set(event.options.get("maxPoolSize", 100), address=address)
+        mongo_pool_connections.set(0, address=address, state="open")
+        mongo_pool_connections.set(0, address=address, state="in_use")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc(address="%s:%s" % event.address, state="open")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        mongo_pool_connections.dec(address="%s:%s" % event.address, state="open")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+    def connection_checked_out(self, event):
+        mongo_pool_connections.inc(address="%s:%s" % event.address, state="in_use")
+
+    def connection_checked_in(self, event):
+        mongo_pool_connections.dec(address="%s:%s" % event.address, state="in_use")
+
+
+def listeners() -> list:
+    """Event listeners to pass to the Motor client as `event_listeners`."""
+    return [CommandListener(), PoolListener()]
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streamed bodies are timed and attributed too."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec()
+            current_request.reset(token)
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            method = scope["method"]
+            http_requests.inc(method=method, route=route, status=status)
+            http_request_duration.observe(elapsed, method=method, route=route)
+            for command, seconds, failed in stats.commands:
+                if failed:
+                    mongo_command_failures.inc(route=route, command=command)
+                else:
+                    mongo_command_duration.observe(seconds, route=route, command=command)
+            if stats.documents_read:
+                mongo_documents_read.inc(stats.documents_read, route=route)
+            if stats.documents_returned:
+                documents_returned.inc(stats.documents_returned, route=route)
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
@@ -0,0 +1,164 @@
+import logging
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from categorizer import rebuild_category_terms
+from indexes import ensure_indexes
+from rollups import rebuild_rollups
+from search import rebuild_search_vocabulary, search_terms
+from storage import DEFAULT_LEDGER, to_cents, to_storage_date
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = 1000
+LEGACY_FILTER = {"amount_cents": {"$exists": False}}
+MIGRATION_ID = "transactions_bson_dates_cents"
+UNASSIGNED_FILTER = {"ledger_id": {"$exists": False}}
+LEDGER_MIGRATION_ID = "ledger_ids"
+UNSEARCHABLE_FILTER = {"search_terms": {"$exists": False}}
+SEARCH_MIGRATION_ID = "search_terms"
+
+# Per migration, the (collection, filter) pairs matching documents it still has to rewrite
+PENDING_CHECKS = {
+    MIGRATION_ID: [("transactions", LEGACY_FILTER)],
+    LEDGER_MIGRATION_ID: [("transactions", UNASSIGNED_FILTER), ("recurring_transactions", UNASSIGNED_FILTER)],
+    SEARCH_MIGRATION_ID: [("transactions", UNSEARCHABLE_FILTER)],
+}
+
+
+async def mark_migrated(db, migration_id: str = MIGRATION_ID):
+    await db.migrations.update_one(
+        {"_id": migration_id},
+        {"$setOnInsert": {"completed_at": datetime.utcnow()}},
+        upsert=True,
+    )
+
+
+async def count_legacy_transactions(db) -> int:
+    """Count documents that still need `python migrations.py`."""
+    legacy = 0
+    for migration_id, checks in PENDING_CHECKS.items():
+        # The marker turns the check into a point lookup once the data is known to be clean
+        if await db.migrations.find_one({"_id": migration_id}):
+            continue
+        pending = 0
+        for collection_name, query in checks:
+            pending += await db[collection_name].count_documents(query)
+        if not pending:
+            await mark_migrated(db, migration_id)
+        legacy += pending
+    return legacy
+
+
+async def migrate_transactions(db, batch_size: int = MIGRATION_BATCH_SIZE) -> dict:
+    """Rewrite legacy transactions to native dates and integer cents.
+
+    Documents are walked in _id order a batch at a time. Each batch is
+    written with one unordered bulk_write. Every update re-checks the
+    legacy filter, so an interrupted run can simply be started again, and
+    concurrent runs never convert a document twice. Rows whose date cannot
+    be parsed are left untouched and counted as skipped.
+    """
+    migrated = skipped = 0
+    last_id = None
+    while True:
+        query = dict(LEGACY_FILTER)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await db.transactions.find(query, {"_id": 1, "id": 1, "amount": 1, "date": 1}) \
+            .sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        operations = []
+        for document in batch:
+            try:
+                changes = {"amount_cents": to_cents(document["amount"]), "date": to_storage_date(document["date"])}
+            except (KeyError, TypeError, ValueError, ArithmeticError):
+                logger.warning("Cannot migrate transaction %s", document.get("id", document["_id"]))
+                skipped += 1
+                continue
+            operations.append(UpdateOne(
+                {"_id": document["_id"], **LEGACY_FILTER},
+                {"$set": changes, "$unset": {"amount": ""}},
+            ))
+        if operations:
+            result = await db.transactions.bulk_write(operations, ordered=False)
+            migrated += result.modified_count
+        logger.info("Migrated %d transactions so far", migrated)
+    return {"migrated": migrated, "skipped": skipped}
+
+
+async def assign_default_ledger(db) -> int:
+    """Move data written before ledgers existed into DEFAULT_LEDGER."""
+    assigned = 0
+    for collection_name in ("transactions", "recurring_transactions"):
+        result = await db[collection_name].update_many(UNASSIGNED_FILTER, {"$set": {"ledger_id": DEFAULT_LEDGER}})
+        assigned += result.modified_count
+    return assigned
+
+
+async def index_descriptions(db, batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """Store search_terms on transactions written before search existed.
+
+    Walks the unindexed rows in _id order like migrate_transactions, and is
+    just as safe to interrupt and re-run.
+    """
+    indexed = 0
+    last_id = None
+    while True:
+        query = dict(UNSEARCHABLE_FILTER)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await db.transactions.find(query, {"_id": 1, "description": 1}) \
+            .sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        result = await db.transactions.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": document["_id"], **UNSEARCHABLE_FILTER},
+                    {"$set": {"search_terms": search_terms(str(document.get("description", "")))}},
+                )
+                for document in batch
+            ],
+            ordered=False,
+        )
+        indexed += result.modified_count
+        logger.info("Indexed %d transaction descriptions so far", indexed)
+    return indexed
+
+
+async def migrate(db) -> dict:
+    # The ledger-keyed rollup index must exist before the rebuild can $merge into it
+    await ensure_indexes(db)
+    result = await migrate_transactions(db)
+    if not result["skipped"]:
+        await mark_migrated(db)
+    result["assigned"] = await assign_default_ledger(db)
+    await mark_migrated(db, LEDGER_MIGRATION_ID)
+    result["indexed"] = await index_descriptions(db)
+    await mark_migrated(db, SEARCH_MIGRATION_ID)
+    await rebuild_search_vocabulary(db)
+    await rebuild_category_terms(db)
+    # Rollups were accumulated as float amounts without ledgers; rebuild them from the migrated data
+    await rebuild_rollups(db)
+    return result
+
+
+def main():
+    """Migrate stored transactions to BSON dates and integer cents, ledgers and search terms."""
+    import asyncio
+    from server import db
+
+    result = asyncio.run(migrate(db))
+    print(f"Migrated {result['migrated']} transactions, skipped {result['skipped']}, "
+          f"assigned {result['assigned']} documents to the {DEFAULT_LEDGER!r} ledger, "
+          f"indexed {result['indexed']} descriptions for search")
+
+
+if __name__ == "__main__":
+    main()
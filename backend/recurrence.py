@@ -0,0 +1,112 @@
+"""Vectorized recurrence arithmetic for weekly, monthly and yearly schedules.
+
+Every schedule is anchored on a date: occurrence k is anchor + k periods,
+with the anchor's day-of-month clamped to the length of each target month.
+A monthly schedule anchored on Jan 31 therefore yields Feb 29, Mar 31,
+Apr 30, ... and never drifts to the 29th. All functions take parallel
+arrays (one entry per template) and work on NumPy datetime64[D] values.
+"""
+from datetime import date
+from typing import Tuple
+
+import numpy as np
+
+FREQUENCIES = ("weekly", "monthly", "yearly")
+
+
+def as_days(values) -> np.ndarray:
+    return np.asarray(values, dtype="datetime64[D]")
+
+
+def validate_frequencies(frequencies) -> np.ndarray:
+    frequencies = np.asarray(frequencies)
+    unknown = set(np.unique(frequencies)) - set(FREQUENCIES)
+    if unknown:
+        raise ValueError(f"Unknown frequency: {sorted(unknown)[0]!r}")
+    return frequencies
+
+
+def shift_months(anchors: np.ndarray, months: np.ndarray) -> np.ndarray:
+    anchor_months = anchors.astype("datetime64[M]")
+    day = (anchors - anchor_months.astype("datetime64[D]")).astype(np.int64)
+    target = anchor_months + months
+    first = target.astype("datetime64[D]")
+    length = ((target + 1).astype("datetime64[D]") - first).astype(np.int64)
+    return first + np.minimum(day, length - 1)
+
+
+def shift(anchors, frequencies, steps) -> np.ndarray:
+    """Occurrence number `steps` of each schedule. Inputs broadcast against each other."""
+    anchors = as_days(anchors)
+    frequencies = validate_frequencies(frequencies)
+    steps = np.asarray(steps, dtype=np.int64)
+    months = np.where(frequencies == "yearly", 12, 1) * steps
+    return np.where(
+        frequencies == "weekly",
+        anchors + 7 * steps,
+        shift_months(anchors, months),
+    )
+
+
+def periods_before(anchors: np.ndarray, frequencies: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """A step index whose occurrence is guaranteed to fall on or before `days` (clipped at 0)."""
+    week_steps = (days - anchors).astype(np.int64) // 7
+    month_steps = (days.astype("datetime64[M]") - anchors.astype("datetime64[M]")).astype(np.int64)
+    month_steps = np.where(frequencies == "yearly", month_steps // 12, month_steps)
+    return np.maximum(np.where(frequencies == "weekly", week_steps, month_steps) - 1, 0)
+
+
+def expand(anchors, frequencies, count: int) -> np.ndarray:
+    """The first `count` occurrences of every schedule as a (templates, count) array."""
+    anchors = as_days(anchors)
+    return shift(anchors[:, None], np.asarray(frequencies)[:, None], np.arange(count)[None, :])
+
+
+def occurrences_between(anchors, frequencies, starts, until) -> Tuple[np.ndarray, np.ndarray]:
+    """Every occurrence with starts <= day <= until, as flat (template index, day) arrays.
+
+    Results are ordered by template index and then by day. Templates are
+    grouped by frequency so weekly schedules don't widen the grid for
+    monthly ones.
+    """
+    anchors = as_days(anchors)
+    frequencies = validate_frequencies(frequencies)
+    starts = np.broadcast_to(as_days(starts), anchors.shape)
+    until = np.broadcast_to(as_days(until), anchors.shape)
+
+    indexes, days = [], []
+    for frequency in FREQUENCIES:
+        group = np.flatnonzero(frequencies == frequency)
+        if not len(group):
+            continue
+        group_frequencies = frequencies[group]
+        first = periods_before(anchors[group], group_frequencies, starts[group])
+        last = periods_before(anchors[group], group_frequencies, until[group]) + 3
+        width = int((last - first).max())
+        steps = first[:, None] + np.arange(width)[None, :]
+        grid = shift(anchors[group][:, None], group_frequencies[:, None], steps)
+        mask = (grid >= starts[group][:, None]) & (grid <= until[group][:, None])
+        rows, cols = np.nonzero(mask)
+        indexes.append(group[rows])
+        days.append(grid[rows, cols])
+
+    if not indexes:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype="datetime64[D]")
+    indexes, days = np.concatenate(indexes), np.concatenate(days)
+    order = np.argsort(indexes, kind="stable")
+    return indexes[order], days[order]
+
+
+def next_after(anchors, frequencies, days) -> np.ndarray:
+    """The first occurrence of each schedule strictly after the matching entry of `days`."""
+    anchors = as_days(anchors)
+    frequencies = validate_frequencies(frequencies)
+    days = np.broadcast_to(as_days(days), anchors.shape)
+    # Four candidate steps from the lower bound always include the answer
+    steps = periods_before(anchors, frequencies, days)[:, None] + np.arange(4)[None, :]
+    grid = shift(anchors[:, None], frequencies[:, None], steps)
+    return grid[np.arange(len(anchors)), np.argmax(grid > days[:, None], axis=1)]
+
+
+def next_occurrence(anchor: date, frequency: str, after: date) -> date:
+    return next_after([anchor], [frequency], [after])[0].astype(date)
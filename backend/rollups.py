@@ -0,0 +1,103 @@
+import logging
+from collections import defaultdict
+from typing import Iterable
+
+from bson import Int64
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# monthly_rollups holds one document per (ledger, month, category, type) with
+# the running amount in cents and the row count. Every transaction write pushes
+# $inc deltas here so analytics never need to scan the ledger.
+
+
+def rollup_key(transaction: dict) -> tuple:
+    return (
+        transaction["ledger_id"],
+        transaction["date"].strftime("%Y-%m"),
+        transaction["category"],
+        transaction["type"],
+    )
+
+
+def rollup_deltas(removed: Iterable[dict] = (), added: Iterable[dict] = ()) -> dict:
+    """Net (cents, count) change per rollup key for stored rows leaving and entering the ledger."""
+    deltas = defaultdict(lambda: [0, 0])
+    for transaction in removed:
+        delta = deltas[rollup_key(transaction)]
+        delta[0] -= transaction["amount_cents"]
+        delta[1] -= 1
+    for transaction in added:
+        delta = deltas[rollup_key(transaction)]
+        delta[0] += transaction["amount_cents"]
+        delta[1] += 1
+    return {key: delta for key, delta in deltas.items() if delta != [0, 0]}
+
+
+async def apply_rollup_deltas(collection, deltas: dict):
+    if not deltas:
+        return
+    await collection.bulk_write(
+        [
+            UpdateOne(
+                {"ledger_id": ledger, "month": month, "category": category, "type": type_},
+                {"$inc": {"amount_cents": Int64(cents), "count": count}},
+                upsert=True,
+            )
+            for (ledger, month, category, type_), (cents, count) in deltas.items()
+        ],
+        ordered=False,
+    )
+
+
+async def update_rollups(db, removed: Iterable[dict] = (), added: Iterable[dict] = ()):
+    await apply_rollup_deltas(db.monthly_rollups, rollup_deltas(removed, added))
+
+
+async def rebuild_rollups(db):
+    """Recompute monthly_rollups from the ledger with a single $merge aggregation.
+
+    Rows not yet migrated to BSON dates and cents are left out; migrations.py
+    rebuilds the rollups again once it has converted them.
+    """
+    await db.monthly_rollups.delete_many({})
+    pipeline = [
+        {"$match": {"date": {"$type": "date"}, "amount_cents": {"$exists": True}}},
+        {"$group": {
+            "_id": {
+                "ledger_id": "$ledger_id",
+                "month": {"$dateToString": {"date": "$date", "format": "%Y-%m"}},
+                "category": "$category",
+                "type": "$type",
+            },
+            "amount_cents": {"$sum": "$amount_cents"},
+            "count": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0,
+            "ledger_id": "$_id.ledger_id",
+            "month": "$_id.month",
+            "category": "$_id.category",
+            "type": "$_id.type",
+            "amount_cents": 1,
+            "count": 1,
+        }},
+        {"$merge": {
+            "into": "monthly_rollups",
+            "on": ["ledger_id", "month", "category", "type"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ]
+    await db.transactions.aggregate(pipeline).to_list(None)
+
+
+async def ensure_rollups(db):
+    # Backfill once for ledgers written before rollups existed
+    if await db.monthly_rollups.estimated_document_count():
+        return
+    if not await db.transactions.estimated_document_count():
+        return
+    logger.info("Backfilling monthly_rollups from transactions")
+    await rebuild_rollups(db)
@@ -0,0 +1,191 @@
+import asyncio
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+from pymongo import UpdateOne
+
+# Every stored transaction carries `search_terms`, the distinct normalized tokens
+# of its description, under a multikey (ledger_id, search_terms) index.
+# search_vocabulary holds one document per (ledger, term) with the number of
+# rows containing it and the term's single-character deletions ("variants").
+# A query token is expanded against the vocabulary into exact, prefix and
+# one-typo matches, all found through indexes, and the expansions are then
+# matched against the transactions' search_terms. Writes keep the vocabulary
+# current through ledger_changed, like the monthly rollups.
+
+MAX_TERM_LENGTH = 32
+MAX_TERMS = 64
+MAX_QUERY_TOKENS = 8
+# Shortest tokens that get prefix and typo expansion
+PREFIX_MIN_LENGTH = 2
+TYPO_MIN_LENGTH = 4
+# Most frequent prefix completions considered per query token
+MAX_PREFIX_EXPANSIONS = 50
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.6
+TYPO_WEIGHT = 0.5
+VOCABULARY_BATCH_SIZE = 1000
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, accent-free word tokens of a text, in order."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    folded = "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+    return [token[:MAX_TERM_LENGTH] for token in TOKEN_PATTERN.findall(folded)]
+
+
+def search_terms(description: str) -> List[str]:
+    return sorted(set(tokenize(description)))[:MAX_TERMS]
+
+
+def deletions(term: str) -> List[str]:
+    return sorted({term[:index] + term[index + 1:] for index in range(len(term))})
+
+
+def term_variants(term: str) -> List[str]:
+    # A shorter term can only be one edit from a typo-matched token by being one of its deletions
+    return deletions(term) if len(term) >= TYPO_MIN_LENGTH else []
+
+
+def within_one_edit(left: str, right: str) -> bool:
+    """True when one insertion, deletion, substitution or adjacent swap turns left into right."""
+    if left == right:
+        return True
+    if abs(len(left) - len(right)) > 1:
+        return False
+    if len(left) == len(right):
+        differences = [index for index, (a, b) in enumerate(zip(left, right)) if a != b]
+        if len(differences) == 1:
+            return True
+        first, second = differences[0], differences[-1]
+        return len(differences) == 2 and second == first + 1 \
+            and left[first] == right[second] and left[second] == right[first]
+    shorter, longer = sorted((left, right), key=len)
+    index = next((index for index, (a, b) in enumerate(zip(shorter, longer)) if a != b), len(shorter))
+    return shorter[index:] == longer[index + 1:]
+
+
+def term_deltas(removed: Iterable[dict] = (), added: Iterable[dict] = ()) -> dict:
+    """Net change in row count per (ledger, term) for stored rows leaving and entering the ledger."""
+    deltas = defaultdict(int)
+    # Rows without search_terms are skipped both ways (see storage.py)
+    for transaction in removed:
+        for term in transaction.get("search_terms", ()):
+            deltas[(transaction["ledger_id"], term)] -= 1
+    for transaction in added:
+        for term in transaction.get("search_terms", ()):
+            deltas[(transaction["ledger_id"], term)] += 1
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+async def apply_term_deltas(collection, deltas: dict):
+    if not deltas:
+        return
+    await collection.bulk_write(
+        [
+            UpdateOne(
+                {"ledger_id": ledger, "term": term},
+                {"$inc": {"count": count}, "$setOnInsert": {"variants": term_variants(term)}},
+                upsert=True,
+            )
+            for (ledger, term), count in deltas.items()
+        ],
+        ordered=False,
+    )
+    emptied = defaultdict(list)
+    for (ledger, term), count in deltas.items():
+        if count < 0:
+            emptied[ledger].append(term)
+    for ledger, terms in emptied.items():
+        await collection.delete_many({"ledger_id": ledger, "term": {"$in": terms}, "count": {"$lte": 0}})
+
+
+async def update_search_vocabulary(db, removed: Iterable[dict] = (), added: Iterable[dict] = ()):
+    await apply_term_deltas(db.search_vocabulary, term_deltas(removed, added))
+
+
+async def rebuild_search_vocabulary(db):
+    """Recount search_vocabulary from the search_terms stored on the ledger."""
+    await db.search_vocabulary.delete_many({})
+    pipeline = [
+        {"$match": {"search_terms.0": {"$exists": True}}},
+        {"$unwind": "$search_terms"},
+        {"$group": {"_id": {"ledger_id": "$ledger_id", "term": "$search_terms"}, "count": {"$sum": 1}}},
+    ]
+    # Variants are computed here rather than in the pipeline, so the counts are streamed back in batches
+    deltas = {}
+    async for row in db.transactions.aggregate(pipeline, allowDiskUse=True):
+        deltas[(row["_id"]["ledger_id"], row["_id"]["term"])] = row["count"]
+        if len(deltas) >= VOCABULARY_BATCH_SIZE:
+            await apply_term_deltas(db.search_vocabulary, deltas)
+            deltas = {}
+    await apply_term_deltas(db.search_vocabulary, deltas)
+
+
+async def expand_token(collection, ledger: str, token: str) -> Dict[str, tuple]:
+    """Vocabulary terms matching one query token, as {term: (weight, row count)}."""
+    keys = [token] + (deletions(token) if len(token) >= TYPO_MIN_LENGTH else [])
+    # A term one edit away shares the token itself or one of its deletions with the term's own deletions
+    lookups = [collection.find(
+        {"ledger_id": ledger, "$or": [{"term": {"$in": keys}}, {"variants": {"$in": keys}}]},
+        {"_id": 0, "term": 1, "count": 1},
+    ).to_list(None)]
+    if len(token) >= PREFIX_MIN_LENGTH:
+        lookups.append(collection.find(
+            {"ledger_id": ledger, "term": {"$regex": "^" + re.escape(token)}},
+            {"_id": 0, "term": 1, "count": 1},
+        ).sort("count", -1).limit(MAX_PREFIX_EXPANSIONS).to_list(MAX_PREFIX_EXPANSIONS))
+    rows = [row for found in await asyncio.gather(*lookups) for row in found]
+
+    matches = {}
+    for row in rows:
+        term = row["term"]
+        if row["count"] <= 0:
+            continue
+        if term == token:
+            weight = EXACT_WEIGHT
+        elif term.startswith(token):
+            weight = PREFIX_WEIGHT
+        elif len(token) >= TYPO_MIN_LENGTH and within_one_edit(token, term):
+            weight = TYPO_WEIGHT
+        else:
+            continue
+        matches[term] = (weight, row["count"])
+    return matches
+
+
+async def expand_query(collection, ledger: str, query: str) -> List[Dict[str, tuple]]:
+    """Expansions per query token; an empty dict means that token matches nothing."""
+    tokens = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TOKENS]
+    return list(await asyncio.gather(*(expand_token(collection, ledger, token) for token in tokens)))
+
+
+def search_filter(expansions: List[Dict[str, tuple]]) -> dict:
+    # Every query token must match, through any of its expansions
+    return {"$and": [{"search_terms": {"$in": sorted(matches)}} for matches in expansions]}
+
+
+def score_expression(expansions: List[Dict[str, tuple]], documents: int) -> dict:
+    """Aggregation expression scoring a row: per token, its best matching expansion weighted by rarity."""
+    token_scores = []
+    for matches in expansions:
+        by_weight = defaultdict(list)
+        for term, (weight, count) in matches.items():
+            rarity = math.log(1 + max(documents, count) / count)
+            by_weight[round(weight * rarity, 6)].append(term)
+        token_scores.append({"$switch": {
+            "branches": [
+                {
+                    "case": {"$or": [{"$in": [term, "$search_terms"]} for term in sorted(terms)]},
+                    "then": weight,
+                }
+                for weight, terms in sorted(by_weight.items(), reverse=True)
+            ],
+            "default": 0,
+        }})
+    return {"$add": token_scores}
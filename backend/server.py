@@ -1,27 +1,99 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, File, Header, HTTPException, Query, Request, Response, UploadFile
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import io
+import orjson
+import asyncio
+import base64
+import hashlib
 import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
 from pathlib import Path
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import urlencode
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Annotated, List, Optional, Sequence
 import uuid
-from datetime import datetime
+from datetime import date, datetime
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from budgets import DEFAULT_ALERT_THRESHOLDS, check_budget_alerts, crossed_thresholds, evaluate_budgets, month_spend, percent_spent
+from cache import create_cache
+from categorizer import Categorizer, ensure_category_terms
+from database import Database
+from indexes import ensure_indexes
+from metrics import MetricsMiddleware, listeners, record_returned, render
+from importer import detect_format, fingerprint, parse_column_overrides, read_statement
+from migrations import count_legacy_transactions
+from rollups import ensure_rollups, update_rollups
+from search import expand_query, score_expression, search_filter, search_terms, update_search_vocabulary
+from storage import DEFAULT_CATEGORY, DEFAULT_LEDGER, as_stored, from_cents, from_storage_date, stored_amount, to_cents, to_storage_date, transaction_to_storage
+# recurrence and forecast pull in NumPy; they are imported by the handlers that use them
+# so worker boot does not pay for it
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection; nothing connects until the lifespan handler warms the pool up.
+# Command and pool listeners feed the /metrics endpoint.
+database = Database(os.environ['MONGO_URL'], os.environ['DB_NAME'], event_listeners=listeners())
+db = database.db
+# Analytics aggregations may be served by secondaries (MONGO_ANALYTICS_READ_PREFERENCE)
+analytics_db = database.analytics
+
+# Transactions are paged by (date, id); streaming exports pull this many rows per round trip
+TRANSACTION_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+# Search results are ranked, so they are paged by offset, and only this deep
+SEARCH_PAGE_SIZE = 50
+SEARCH_MAX_OFFSET = 1000
+# Anomaly detection reads the whole (filtered) ledger in cursor batches of this size
+ANOMALY_BATCH_SIZE = 5000
+# Bulk ingest writes rows in unordered insert_many chunks of this size
+BULK_BATCH_SIZE = 1000
+# Seconds between passes that post due recurring transactions; 0 disables the scheduler
+RECURRING_SCHEDULER_INTERVAL = int(os.environ.get("RECURRING_SCHEDULER_INTERVAL", "300"))
+
+DATE_PATTERN = r"^\d{4}-\d{2}-\d{2}$"
+MONTH_PATTERN = r"^\d{4}-\d{2}$"
+LEDGER_PATTERN = r"^[A-Za-z0-9_.-]{1,64}$"
+# Amounts are finite and small enough that their cents, and sums of them, stay within an Int64
+MAX_AMOUNT = 10 ** 13
+Amount = Annotated[float, Field(allow_inf_nan=False, ge=-MAX_AMOUNT, le=MAX_AMOUNT)]
+
+# Anomaly reports list at most this many duplicate groups and outliers each
+ANOMALY_REPORT_LIMIT = 200
+
+# Analytics responses are cached per query and invalidated by writes to the data they read
+ANALYTICS_CACHE_TTL = int(os.environ.get("ANALYTICS_CACHE_TTL", "300"))
+analytics_cache = create_cache(os.environ.get("ANALYTICS_CACHE_URL"))
+
+# Per-ledger category models, trained from every write and used to fill in uncategorized rows
+categorizer = Categorizer()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await provision_database()
+    app.state.recurring_scheduler = None
+    if RECURRING_SCHEDULER_INTERVAL > 0:
+        app.state.recurring_scheduler = asyncio.create_task(run_recurring_scheduler())
+    try:
+        yield
+    finally:
+        if app.state.recurring_scheduler:
+            app.state.recurring_scheduler.cancel()
+        database.close()
 
 # Create the main app without a prefix
-app = FastAPI(title="Budget Planner API", version="1.0.0")
+app = FastAPI(title="Budget Planner API", version="1.0.0", lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -30,6 +102,7 @@ api_router = APIRouter(prefix="/api")
 # Define Models
 class Transaction(BaseModel):
     id: Optional[str] = Field(default_factory=lambda: str(uuid.uuid4()))
+    ledger_id: str = DEFAULT_LEDGER
     type: str  # "income" or "expense"
     category: str
     amount: float
@@ -38,81 +111,489 @@ class Transaction(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class SearchResult(Transaction):
+    score: float
+
 class TransactionCreate(BaseModel):
     type: str
-    category: str
-    amount: float
+    category: str = DEFAULT_CATEGORY  # uncategorized rows are categorized automatically when possible
+    amount: Amount
     description: str
     date: str
 
 class TransactionUpdate(BaseModel):
     type: Optional[str] = None
     category: Optional[str] = None
-    amount: Optional[float] = None
+    amount: Optional[Amount] = None
     description: Optional[str] = None
     date: Optional[str] = None
 
 class RecurringTransaction(BaseModel):
     id: Optional[str] = Field(default_factory=lambda: str(uuid.uuid4()))
+    ledger_id: str = DEFAULT_LEDGER
     type: str  # "income" or "expense"
     category: str
     amount: float
     description: str
     frequency: str  # "weekly", "monthly", "yearly"
     nextDate: str
+    startDate: Optional[str] = None  # schedule anchor; its day-of-month is kept across short months
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class RecurringTransactionCreate(BaseModel):
     type: str
     category: str
-    amount: float
+    amount: Amount
     description: str
     frequency: str
 
 class RecurringTransactionUpdate(BaseModel):
     type: Optional[str] = None
     category: Optional[str] = None
-    amount: Optional[float] = None
+    amount: Optional[Amount] = None
     description: Optional[str] = None
     frequency: Optional[str] = None
 
+class Budget(BaseModel):
+    id: Optional[str] = Field(default_factory=lambda: str(uuid.uuid4()))
+    ledger_id: str = DEFAULT_LEDGER
+    category: str
+    limit: float  # per calendar month
+    alert_thresholds: List[int] = DEFAULT_ALERT_THRESHOLDS  # percent of the limit
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class BudgetCreate(BaseModel):
+    category: str
+    limit: Amount = Field(gt=0)
+    alert_thresholds: List[int] = DEFAULT_ALERT_THRESHOLDS
+
+class BudgetUpdate(BaseModel):
+    category: Optional[str] = None
+    limit: Optional[Amount] = Field(None, gt=0)
+    alert_thresholds: Optional[List[int]] = None
+
+class BudgetStatus(BaseModel):
+    budget_id: str
+    category: str
+    month: str
+    limit: float
+    spent: float
+    remaining: float
+    percent: float
+    alert: Optional[int] = None  # highest alert threshold reached
+
+class BudgetAlert(BaseModel):
+    budget_id: str
+    category: str
+    month: str
+    threshold: int
+    spent: float
+    limit: float
+    created_at: datetime
+
+class BulkRowError(BaseModel):
+    index: int
+    error: str
+
+class BulkInsertResponse(BaseModel):
+    inserted: int = 0
+    duplicates: int = 0
+    categorized: int = 0
+    errors: List[BulkRowError] = []
+
+class CategorySuggestion(BaseModel):
+    category: str
+    confidence: float
+
+class BulkDeleteResponse(BaseModel):
+    message: str
+    deleted: int
+
 class SummaryResponse(BaseModel):
     income: float
     expenses: float
     balance: float
 
+class ForecastPoint(BaseModel):
+    date: str
+    change: float
+    balance: float
+
+class ForecastResponse(BaseModel):
+    start_balance: float
+    granularity: str
+    points: List[ForecastPoint]
+
+class BalancePoint(BaseModel):
+    date: str  # first day of the bucket; YYYY-MM for monthly series
+    income: float
+    expense: float
+    balance: float
+    average: Optional[float] = None  # rolling mean of balance, when a window is requested
+
+class BalanceSeriesResponse(BaseModel):
+    granularity: str
+    opening_balance: float
+    points: List[BalancePoint]
+
 class CategoryBreakdown(BaseModel):
     category: str
     income: float
     expense: float
 
-# Helper function to convert ObjectId to string
+class MonthlyBreakdown(BaseModel):
+    month: str
+    category: str
+    income: float
+    expense: float
+
+class DuplicateGroup(BaseModel):
+    exact: bool  # every row posted on the same day
+    type: str
+    amount: float
+    description: str
+    dates: List[str]
+    ids: List[str]
+
+class Outlier(BaseModel):
+    id: str
+    date: str
+    type: str
+    category: str
+    amount: float
+    description: str
+    score: float  # standard deviations (zscore) or interquartile ranges (iqr, at least 5% of typical) from typical
+    typical: float  # category mean (zscore) or median (iqr)
+
+class AnomalyReport(BaseModel):
+    scanned: int
+    duplicate_groups: int
+    outlier_count: int
+    duplicates: List[DuplicateGroup]
+    outliers: List[Outlier]
+
+TRANSACTION_FIELDS = ("id", "ledger_id", "type", "category", "amount", "description", "date", "created_at", "updated_at")
+
+# Helper function to convert a stored transaction back to its API shape
 def transaction_helper(transaction) -> dict:
-    return {
-        "id": transaction["id"],
-        "type": transaction["type"],
-        "category": transaction["category"],
-        "amount": transaction["amount"],
-        "description": transaction["description"],
-        "date": transaction["date"],
-        "created_at": transaction["created_at"],
-        "updated_at": transaction["updated_at"]
-    }
+    return lean_transaction(transaction, TRANSACTION_FIELDS)
+
+def lean_transaction(transaction, fields: tuple) -> dict:
+    lean = {}
+    for field in fields:
+        if field == "amount":
+            lean["amount"] = stored_amount(transaction)
+        elif field == "date":
+            lean["date"] = from_storage_date(transaction["date"])
+        else:
+            lean[field] = transaction[field]
+    return lean
+
+def transaction_fields(
+    fields: Optional[str] = Query(None, description="Comma-separated list of fields to return"),
+) -> tuple:
+    if not fields:
+        return TRANSACTION_FIELDS
+    selected = tuple(field.strip() for field in fields.split(",") if field.strip())
+    unknown = sorted(set(selected) - set(TRANSACTION_FIELDS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+def transaction_projection(fields: tuple) -> dict:
+    # id and date are always read because the keyset cursor is built from them
+    projection = {"_id": 0, "id": 1, "date": 1}
+    for field in fields:
+        if field == "amount":
+            projection.update(amount_cents=1, amount=1)
+        else:
+            projection[field] = 1
+    return projection
 
 def recurring_transaction_helper(transaction) -> dict:
     return {
         "id": transaction["id"],
+        "ledger_id": transaction["ledger_id"],
         "type": transaction["type"],
         "category": transaction["category"],
         "amount": transaction["amount"],
         "description": transaction["description"],
         "frequency": transaction["frequency"],
         "nextDate": transaction["nextDate"],
+        "startDate": transaction.get("startDate"),
         "created_at": transaction["created_at"],
         "updated_at": transaction["updated_at"]
     }
 
+def budget_helper(budget) -> dict:
+    return {
+        "id": budget["id"],
+        "ledger_id": budget["ledger_id"],
+        "category": budget["category"],
+        "limit": from_cents(budget["limit_cents"]),
+        "alert_thresholds": budget["alert_thresholds"],
+        "created_at": budget["created_at"],
+        "updated_at": budget["updated_at"]
+    }
+
+def budget_to_storage(budget: dict) -> dict:
+    """Validate alert thresholds and store the limit as integer cents, like transaction amounts."""
+    stored = dict(budget)
+    if "alert_thresholds" in stored:
+        if not all(1 <= threshold <= 1000 for threshold in stored["alert_thresholds"]):
+            raise HTTPException(status_code=400, detail="Alert thresholds must be percentages between 1 and 1000")
+        stored["alert_thresholds"] = sorted(set(stored["alert_thresholds"]))
+    if "limit" in stored:
+        stored["limit_cents"] = to_cents(stored.pop("limit"))
+    return stored
+
+STORAGE_ERRORS = {
+    "amount": "amount must be a finite number",
+    "date": "date must be an ISO date (YYYY-MM-DD)",
+}
+
+def stored_or_422(transaction: dict) -> dict:
+    # Fields are converted one at a time so the error names the one that failed
+    for field, detail in STORAGE_ERRORS.items():
+        if field in transaction:
+            try:
+                transaction_to_storage({field: transaction[field]})
+            except (ArithmeticError, ValueError):
+                raise HTTPException(status_code=422, detail=detail)
+    return transaction_to_storage(transaction)
+
+def update_document(transaction_update: TransactionUpdate) -> dict:
+    update_data = stored_or_422({k: v for k, v in transaction_update.dict().items() if v is not None})
+    update_data["updated_at"] = datetime.utcnow()
+    # A category set by hand replaces an automatic one, and from now on trains the categorizer
+    if "category" in update_data:
+        update_data["auto_categorized"] = False
+    return update_data
+
+# Keyset pagination helpers: the cursor is an opaque encoding of the last (date, id) pair
+def encode_cursor(transaction) -> str:
+    raw = f'{transaction["date"]}|{transaction["id"]}'.encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        day, transaction_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return to_storage_date(day), transaction_id
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+def keyset_filter(after: Optional[str]) -> dict:
+    if not after:
+        return {}
+    day, transaction_id = decode_cursor(after)
+    return {"$or": [
+        {"date": {"$gt": day}},
+        {"date": day, "id": {"$gt": transaction_id}},
+    ]}
+
+# Bulk ingest helpers
+async def read_bulk_rows(request: Request):
+    # NDJSON bodies are split as they arrive so the request is never buffered whole
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
+        return
+
+    try:
+        rows = orjson.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body is not valid JSON")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of transactions")
+    for row in rows:
+        yield row
+
+async def insert_batch(collection, batch: list, offsets: list, errors: list) -> list:
+    """Insert a batch unordered and return the documents that were written."""
+    try:
+        await collection.insert_many(batch, ordered=False)
+        return batch
+    except BulkWriteError as exc:
+        failed = set()
+        for write_error in exc.details["writeErrors"]:
+            failed.add(write_error["index"])
+            errors.append(BulkRowError(index=offsets[write_error["index"]], error=write_error["errmsg"]))
+        return [document for position, document in enumerate(batch) if position not in failed]
+
+async def drop_existing(batch: list, offsets: list, started_at: datetime, ledger: str) -> tuple:
+    # Only rows that predate this import count, so repeated lines within one statement are kept
+    dates = list({transaction["date"] for transaction in batch})
+    existing = set()
+    async for transaction in db.transactions.find(
+        {"ledger_id": ledger, "date": {"$in": dates}, "created_at": {"$lt": started_at}},
+        {"_id": 0, "date": 1, "amount_cents": 1, "description": 1},
+    ):
+        existing.add(fingerprint(transaction))
+    kept = [(transaction, offset) for transaction, offset in zip(batch, offsets) if fingerprint(transaction) not in existing]
+    return [transaction for transaction, _ in kept], [offset for _, offset in kept]
+
+async def flush_batch(
+    batch: list, offsets: list, result: BulkInsertResponse, started_at: Optional[datetime], ledger: str,
+):
+    if started_at is not None:
+        kept, kept_offsets = await drop_existing(batch, offsets, started_at, ledger)
+        result.duplicates += len(batch) - len(kept)
+        batch, offsets = kept, kept_offsets
+    if batch:
+        result.categorized += await categorizer.assign(db, ledger, batch)
+        inserted = await insert_batch(db.transactions, batch, offsets, result.errors)
+        await ledger_changed(added=inserted)
+        result.inserted += len(inserted)
+
+async def ingest_rows(rows, skip_duplicates: bool = False, ledger: str = DEFAULT_LEDGER) -> BulkInsertResponse:
+    """Validate rows from an async iterable and write them into a ledger in unordered batches."""
+    result = BulkInsertResponse()
+    started_at = datetime.utcnow() if skip_duplicates else None
+    batch, offsets = [], []
+    index = -1
+    async for row in rows:
+        index += 1
+        try:
+            if isinstance(row, bytes):
+                row = orjson.loads(row)
+            transaction_obj = Transaction(**TransactionCreate(**row).dict(), ledger_id=ledger)
+            document = transaction_to_storage(transaction_obj.dict())
+        except (ArithmeticError, ValueError, TypeError) as exc:
+            result.errors.append(BulkRowError(index=index, error=str(exc)))
+            continue
+        batch.append(document)
+        offsets.append(index)
+        if len(batch) >= BULK_BATCH_SIZE:
+            await flush_batch(batch, offsets, result, started_at, ledger)
+            batch, offsets = [], []
+    if batch:
+        await flush_batch(batch, offsets, result, started_at, ledger)
+
+    result.errors.sort(key=lambda error: error.index)
+    return result
+
+async def iterate(rows):
+    for row in rows:
+        yield row
+
+async def ledger_changed(removed: Sequence[dict] = (), added: Sequence[dict] = ()):
+    """Propagate transaction writes to the rollups, budget alerts, search vocabulary, categorizer and analytics cache."""
+    if not removed and not added:
+        return
+    stored_added = [as_stored(transaction) for transaction in added]
+    await update_rollups(db, removed=[as_stored(transaction) for transaction in removed], added=stored_added)
+    # Only added expenses can push a budget over a threshold
+    await check_budget_alerts(db, added=stored_added)
+    await update_search_vocabulary(db, removed=removed, added=added)
+    await categorizer.learn(db, removed=removed, added=added)
+    for ledger in {transaction["ledger_id"] for transaction in (*removed, *added)}:
+        await analytics_cache.bump(f"transactions:{ledger}")
+
+async def cached_json(request: Request, scopes: tuple, compute, *key_parts) -> Response:
+    # The ETag is derived from the scope versions, so a revalidation never touches the database
+    versions = [await analytics_cache.version(scope) for scope in scopes]
+    key = "|".join([
+        request.url.path,
+        urlencode(sorted(request.query_params.multi_items())),
+        *(f"{scope}={tag}" for scope, (tag, _) in zip(scopes, versions)),
+        *map(str, key_parts),
+    ])
+    etag = '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+    last_modified = max(modified for _, modified in versions)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(last_modified, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    if request.headers.get("if-none-match") == etag or not_modified_since(request, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    body = await analytics_cache.get(key)
+    if body is None:
+        result = await compute()
+        record_returned(len(result) if isinstance(result, list) else 1)
+        body = orjson.dumps(jsonable_encoder(result))
+        await analytics_cache.set(key, body, ANALYTICS_CACHE_TTL)
+    return Response(body, media_type="application/json", headers=headers)
+
+def not_modified_since(request: Request, last_modified: float) -> bool:
+    if "if-none-match" in request.headers or "if-modified-since" not in request.headers:
+        return False
+    try:
+        since = parsedate_to_datetime(request.headers["if-modified-since"])
+    except (TypeError, ValueError):
+        return False
+    return int(last_modified) <= since.timestamp()
+
+# Every request works inside one ledger (tenant), named by the X-Ledger-Id header.
+# Requests without it use the default ledger, which holds data from before ledgers existed.
+def current_ledger(x_ledger_id: str = Header(DEFAULT_LEDGER, pattern=LEDGER_PATTERN)) -> str:
+    return x_ledger_id
+
+def in_ledger(ledger: str, query: Optional[dict] = None) -> dict:
+    # ledger_id leads every index, so this keeps each query within one ledger's keys
+    return {"ledger_id": ledger, **(query or {})}
+
+def filter_date(name: str, value: str) -> datetime:
+    # DATE_PATTERN admits values such as 2024-02-30 that are not calendar dates
+    try:
+        return to_storage_date(value)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"{name} must be a valid date (YYYY-MM-DD)")
+
+# Query filters shared by the transaction list and the analytics routes.
+# Date bounds become BSON dates served by the (date, ...) indexes.
+def transaction_filter(
+    start_date: Optional[str] = Query(None, pattern=DATE_PATTERN),
+    end_date: Optional[str] = Query(None, pattern=DATE_PATTERN),
+    type_: Optional[str] = Query(None, alias="type", pattern="^(income|expense)$"),
+    category: List[str] = Query([]),
+    min_amount: Optional[float] = Query(None, ge=0, le=MAX_AMOUNT, allow_inf_nan=False),
+    max_amount: Optional[float] = Query(None, ge=0, le=MAX_AMOUNT, allow_inf_nan=False),
+) -> dict:
+    query = {}
+    if start_date or end_date:
+        query["date"] = {}
+        if start_date:
+            query["date"]["$gte"] = filter_date("start_date", start_date)
+        if end_date:
+            query["date"]["$lte"] = filter_date("end_date", end_date)
+    if type_:
+        query["type"] = type_
+    if category:
+        query["category"] = category[0] if len(category) == 1 else {"$in": category}
+    if min_amount is not None or max_amount is not None:
+        query["amount_cents"] = {}
+        if min_amount is not None:
+            query["amount_cents"]["$gte"] = to_cents(min_amount)
+        if max_amount is not None:
+            query["amount_cents"]["$lte"] = to_cents(max_amount)
+    return query
+
+def combine_filters(*filters: dict) -> dict:
+    filters = [query for query in filters if query]
+    if len(filters) > 1:
+        return {"$and": filters}
+    return filters[0] if filters else {}
+
+async def stream_ndjson(cursor, transform):
+    count = 0
+    try:
+        async for document in cursor:
+            count += 1
+            yield orjson.dumps(transform(document)) + b"\n"
+    finally:
+        record_returned(count)
+
 # Routes
 @api_router.get("/")
 async def root():
@@ -120,144 +601,875 @@ async def root():
 
 # Transaction routes
 @api_router.post("/transactions", response_model=Transaction)
-async def create_transaction(transaction: TransactionCreate):
+async def create_transaction(transaction: TransactionCreate, ledger: str = Depends(current_ledger)):
     transaction_dict = transaction.dict()
-    transaction_obj = Transaction(**transaction_dict)
-    result = await db.transactions.insert_one(transaction_obj.dict())
+    transaction_obj = Transaction(**transaction_dict, ledger_id=ledger)
+    document = stored_or_422(transaction_obj.dict())
+    await categorizer.assign(db, ledger, [document])
+    result = await db.transactions.insert_one(document)
     if result.inserted_id:
-        return transaction_obj
+        await ledger_changed(added=[document])
+        return Transaction(**transaction_helper(document))
     raise HTTPException(status_code=400, detail="Transaction creation failed")
 
+@api_router.post("/transactions/bulk", response_model=BulkInsertResponse)
+async def create_transactions_bulk(request: Request, ledger: str = Depends(current_ledger)):
+    return await ingest_rows(read_bulk_rows(request), ledger=ledger)
+
+def bulk_selection(
+    ids: List[str] = Query([]),
+    filters: dict = Depends(transaction_filter),
+    ledger: str = Depends(current_ledger),
+) -> dict:
+    # Refuse an empty selection so a bare request can never touch the whole ledger
+    if not ids and not filters:
+        raise HTTPException(status_code=400, detail="Select transactions with ids or at least one filter")
+    return in_ledger(ledger, combine_filters({"id": {"$in": ids}} if ids else {}, filters))
+
+async def write_claimed(query: dict, projection: dict, write) -> list:
+    """Claim the rows matching query, then write them all at once; returns the pre-images of the claimed rows.
+
+    Three round trips however many rows match: the claim, the read of the
+    pre-images and one update_many or delete_many on the claim. Rows another
+    bulk write has claimed are left to it, so no row is propagated twice.
+    """
+    claim = {"bulk_op": str(uuid.uuid4())}
+    result = await db.transactions.update_many({**query, "bulk_op": {"$exists": False}}, {"$set": claim})
+    if not result.modified_count:
+        return []
+    try:
+        previous = await db.transactions.find(claim, projection).to_list(None)
+        await write(claim)
+    except Exception:
+        await db.transactions.update_many(claim, {"$unset": {"bulk_op": ""}})
+        raise
+    return previous
+
+@api_router.patch("/transactions/bulk", response_model=List[Transaction])
+async def update_transactions_bulk(
+    transaction_update: TransactionUpdate,
+    query: dict = Depends(bulk_selection),
+):
+    update_data = update_document(transaction_update)
+
+    # Pre-images feed the rollups; the post-images are derived from them
+    previous = await write_claimed(query, {"_id": 0, "bulk_op": 0}, lambda claim: db.transactions.update_many(
+        claim, {"$set": update_data, "$unset": {"bulk_op": ""}},
+    ))
+    if not previous:
+        return []
+    updated = [{**transaction, **update_data} for transaction in previous]
+    await ledger_changed(removed=previous, added=updated)
+    return [Transaction(**transaction_helper(transaction)) for transaction in updated]
+
+@api_router.delete("/transactions/bulk", response_model=BulkDeleteResponse)
+async def delete_transactions_bulk(query: dict = Depends(bulk_selection)):
+    deleted = await write_claimed(
+        query,
+        {
+            "_id": 0, "id": 1, "ledger_id": 1, "type": 1, "category": 1,
+            "amount_cents": 1, "amount": 1, "date": 1, "search_terms": 1, "auto_categorized": 1,
+        },
+        db.transactions.delete_many,
+    )
+    if deleted:
+        await ledger_changed(removed=deleted)
+    return BulkDeleteResponse(message="Transactions deleted successfully", deleted=len(deleted))
+
+@api_router.post("/transactions/import", response_model=BulkInsertResponse)
+async def import_statement(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|ofx)$"),
+    columns: List[str] = Query([]),
+    date_format: Optional[str] = None,
+    decimal_separator: Optional[str] = Query(None, pattern="^[.,]$"),
+    ledger: str = Depends(current_ledger),
+):
+    # The upload is spooled to disk by Starlette; wrapping it keeps parsing incremental
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        rows = read_statement(
+            stream,
+            format or detect_format(file.filename or ""),
+            parse_column_overrides(columns),
+            date_format,
+            decimal_separator,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return await ingest_rows(iterate(rows), skip_duplicates=True, ledger=ledger)
+
 @api_router.get("/transactions", response_model=List[Transaction])
-async def get_transactions():
-    transactions = await db.transactions.find().to_list(1000)
-    return [Transaction(**transaction_helper(transaction)) for transaction in transactions]
+async def get_transactions(
+    limit: Optional[int] = Query(None, ge=1, le=TRANSACTION_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    filters: dict = Depends(transaction_filter),
+    fields: tuple = Depends(transaction_fields),
+    ledger: str = Depends(current_ledger),
+):
+    query = in_ledger(ledger, combine_filters(filters, keyset_filter(after)))
+    cursor = db.transactions.find(query, transaction_projection(fields)).sort([("date", 1), ("id", 1)])
+
+    # NDJSON mode pipes the cursor straight through, so a full export never sits in memory
+    if stream:
+        if limit:
+            cursor = cursor.limit(limit)
+        return StreamingResponse(
+            stream_ndjson(cursor.batch_size(STREAM_BATCH_SIZE), lambda document: lean_transaction(document, fields)),
+            media_type="application/x-ndjson",
+        )
+
+    # Fetch one extra row to learn whether another page exists
+    page_size = limit or TRANSACTION_PAGE_SIZE
+    transactions = await cursor.limit(page_size + 1).to_list(page_size + 1)
+    headers = {}
+    if len(transactions) > page_size:
+        transactions = transactions[:page_size]
+        headers["X-Next-Cursor"] = encode_cursor(lean_transaction(transactions[-1], ("id", "date")))
+    record_returned(len(transactions))
+
+    # Rows are already in their API shape; returning the response directly skips the
+    # per-row model construction and response_model re-validation
+    return ORJSONResponse([lean_transaction(transaction, fields) for transaction in transactions], headers=headers)
+
+@api_router.get("/transactions/search", response_model=List[SearchResult])
+async def search_transactions(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(SEARCH_PAGE_SIZE, ge=1, le=SEARCH_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=SEARCH_MAX_OFFSET),
+    filters: dict = Depends(transaction_filter),
+    ledger: str = Depends(current_ledger),
+):
+    # Query tokens are expanded to exact, prefix and one-typo vocabulary terms first,
+    # so the ledger itself is only searched through the (ledger_id, search_terms) index
+    expansions = await expand_query(db.search_vocabulary, ledger, q)
+    if not expansions or not all(expansions):
+        record_returned(0)
+        return ORJSONResponse([])
+
+    # Rarer terms rank higher; the ledger size comes from the rollups, not a count over rows
+    totals = await analytics_db.monthly_rollups.aggregate(
+        [{"$match": in_ledger(ledger)}, {"$group": {"_id": None, "count": {"$sum": "$count"}}}]
+    ).to_list(1)
+    documents = totals[0]["count"] if totals else 0
+
+    transactions = await db.transactions.aggregate([
+        {"$match": in_ledger(ledger, combine_filters(filters, search_filter(expansions)))},
+        {"$addFields": {"score": score_expression(expansions, documents)}},
+        {"$sort": {"score": -1, "date": -1, "id": 1}},
+        {"$skip": offset},
+        {"$limit": limit + 1},
+        {"$project": {"_id": 0, "search_terms": 0}},
+    ]).to_list(limit + 1)
+    headers = {}
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        headers["X-Next-Offset"] = str(offset + limit)
+    record_returned(len(transactions))
+    return ORJSONResponse(
+        [
+            {**transaction_helper(transaction), "score": round(transaction["score"], 4)}
+            for transaction in transactions
+        ],
+        headers=headers,
+    )
+
+@api_router.get("/transactions/export")
+async def export_transactions(
+    format: str = Query("parquet", pattern="^(parquet|arrow)$"),
+    filters: dict = Depends(transaction_filter),
+    ledger: str = Depends(current_ledger),
+):
+    from export import EXPORT_FORMATS, EXPORT_PROJECTION, stream_export
+
+    # Typed columnar snapshot for pandas/DuckDB, encoded batch by batch as the cursor is read
+    cursor = analytics_db.transactions.find(in_ledger(ledger, filters), EXPORT_PROJECTION) \
+        .sort([("date", 1), ("id", 1)])
+    extension, media_type = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        stream_export(cursor, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="transactions-{ledger}{extension}"'},
+    )
 
 @api_router.get("/transactions/{transaction_id}", response_model=Transaction)
-async def get_transaction(transaction_id: str):
-    transaction = await db.transactions.find_one({"id": transaction_id})
+async def get_transaction(transaction_id: str, ledger: str = Depends(current_ledger)):
+    transaction = await db.transactions.find_one(in_ledger(ledger, {"id": transaction_id}))
     if transaction:
         return Transaction(**transaction_helper(transaction))
     raise HTTPException(status_code=404, detail="Transaction not found")
 
 @api_router.put("/transactions/{transaction_id}", response_model=Transaction)
-async def update_transaction(transaction_id: str, transaction_update: TransactionUpdate):
-    update_data = {k: v for k, v in transaction_update.dict().items() if v is not None}
-    update_data["updated_at"] = datetime.utcnow()
+async def update_transaction(
+    transaction_id: str, transaction_update: TransactionUpdate, ledger: str = Depends(current_ledger),
+):
+    update_data = update_document(transaction_update)
     
-    result = await db.transactions.update_one(
-        {"id": transaction_id}, 
-        {"$set": update_data}
+    # The pre-image tells the rollups which (month, category, type) bucket the row is leaving
+    previous = await db.transactions.find_one_and_update(
+        in_ledger(ledger, {"id": transaction_id}),
+        {"$set": update_data},
+        return_document=ReturnDocument.BEFORE,
     )
     
-    if result.matched_count:
-        updated_transaction = await db.transactions.find_one({"id": transaction_id})
+    if previous:
+        updated_transaction = {**previous, **update_data}
+        await ledger_changed(removed=[previous], added=[updated_transaction])
         return Transaction(**transaction_helper(updated_transaction))
     raise HTTPException(status_code=404, detail="Transaction not found")
 
 @api_router.delete("/transactions/{transaction_id}")
-async def delete_transaction(transaction_id: str):
-    result = await db.transactions.delete_one({"id": transaction_id})
-    if result.deleted_count:
+async def delete_transaction(transaction_id: str, ledger: str = Depends(current_ledger)):
+    deleted = await db.transactions.find_one_and_delete(in_ledger(ledger, {"id": transaction_id}))
+    if deleted:
+        await ledger_changed(removed=[deleted])
         return {"message": "Transaction deleted successfully"}
     raise HTTPException(status_code=404, detail="Transaction not found")
 
+@api_router.get("/categories/suggest", response_model=List[CategorySuggestion])
+async def suggest_categories(
+    description: str = Query(..., min_length=1, max_length=500),
+    type_: str = Query("expense", alias="type", pattern="^(income|expense)$"),
+    limit: int = Query(3, ge=1, le=10),
+    ledger: str = Depends(current_ledger),
+):
+    suggestions = await categorizer.suggest(db, ledger, type_, search_terms(description), limit)
+    return [CategorySuggestion(category=category, confidence=round(confidence, 4)) for category, confidence in suggestions]
+
+# Budget routes
+@api_router.post("/budgets", response_model=Budget)
+async def create_budget(budget: BudgetCreate, ledger: str = Depends(current_ledger)):
+    document = budget_to_storage(Budget(**budget.dict(), ledger_id=ledger).dict())
+    try:
+        await db.budgets.insert_one(document)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="A budget for this category already exists")
+    await analytics_cache.bump(f"budgets:{ledger}")
+    # Spending already past a threshold this month alerts straight away
+    await evaluate_budgets(db, ledger, date.today().strftime("%Y-%m"), [document["category"]])
+    return Budget(**budget_helper(document))
+
+@api_router.get("/budgets", response_model=List[Budget])
+async def get_budgets(ledger: str = Depends(current_ledger)):
+    budgets = await db.budgets.find(in_ledger(ledger)).sort("category", 1).to_list(1000)
+    record_returned(len(budgets))
+    return [Budget(**budget_helper(budget)) for budget in budgets]
+
+@api_router.get("/budgets/status", response_model=List[BudgetStatus])
+async def get_budget_status(
+    request: Request,
+    month: Optional[str] = Query(None, pattern=MONTH_PATTERN),
+    ledger: str = Depends(current_ledger),
+):
+    # The current month is part of the cache key so the report rolls over at midnight
+    month = month or date.today().strftime("%Y-%m")
+    return await cached_json(
+        request,
+        (f"transactions:{ledger}", f"budgets:{ledger}"),
+        lambda: compute_budget_status(ledger, month),
+        month,
+    )
+
+async def compute_budget_status(ledger: str, month: str) -> List[BudgetStatus]:
+    budgets = await analytics_db.budgets.find(in_ledger(ledger), {"_id": 0}).sort("category", 1).to_list(None)
+    spend = await month_spend(analytics_db.monthly_rollups, ledger, month, [budget["category"] for budget in budgets])
+    statuses = []
+    for budget in budgets:
+        spent = spend.get(budget["category"], 0)
+        crossed = crossed_thresholds(budget["alert_thresholds"], spent, budget["limit_cents"])
+        statuses.append(BudgetStatus(
+            budget_id=budget["id"],
+            category=budget["category"],
+            month=month,
+            limit=from_cents(budget["limit_cents"]),
+            spent=from_cents(spent),
+            remaining=from_cents(budget["limit_cents"] - spent),
+            percent=percent_spent(spent, budget["limit_cents"]),
+            alert=crossed[-1] if crossed else None,
+        ))
+    return statuses
+
+@api_router.get("/budgets/alerts", response_model=List[BudgetAlert])
+async def get_budget_alerts(
+    month: Optional[str] = Query(None, pattern=MONTH_PATTERN),
+    ledger: str = Depends(current_ledger),
+):
+    query = in_ledger(ledger, {"month": month} if month else {})
+    alerts = await db.budget_alerts.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    record_returned(len(alerts))
+    return [
+        BudgetAlert(
+            budget_id=alert["budget_id"],
+            category=alert["category"],
+            month=alert["month"],
+            threshold=alert["threshold"],
+            spent=from_cents(alert["spent_cents"]),
+            limit=from_cents(alert["limit_cents"]),
+            created_at=alert["created_at"],
+        )
+        for alert in alerts
+    ]
+
+@api_router.get("/budgets/{budget_id}", response_model=Budget)
+async def get_budget(budget_id: str, ledger: str = Depends(current_ledger)):
+    budget = await db.budgets.find_one(in_ledger(ledger, {"id": budget_id}))
+    if budget:
+        return Budget(**budget_helper(budget))
+    raise HTTPException(status_code=404, detail="Budget not found")
+
+@api_router.put("/budgets/{budget_id}", response_model=Budget)
+async def update_budget(budget_id: str, budget_update: BudgetUpdate, ledger: str = Depends(current_ledger)):
+    update_data = budget_to_storage({k: v for k, v in budget_update.dict().items() if v is not None})
+    update_data["updated_at"] = datetime.utcnow()
+    try:
+        updated_budget = await db.budgets.find_one_and_update(
+            in_ledger(ledger, {"id": budget_id}),
+            {"$set": update_data},
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="A budget for this category already exists")
+    if updated_budget:
+        await analytics_cache.bump(f"budgets:{ledger}")
+        # A lower limit or threshold may already be exceeded
+        await evaluate_budgets(db, ledger, date.today().strftime("%Y-%m"), [updated_budget["category"]])
+        return Budget(**budget_helper(updated_budget))
+    raise HTTPException(status_code=404, detail="Budget not found")
+
+@api_router.delete("/budgets/{budget_id}")
+async def delete_budget(budget_id: str, ledger: str = Depends(current_ledger)):
+    result = await db.budgets.delete_one(in_ledger(ledger, {"id": budget_id}))
+    if result.deleted_count:
+        await db.budget_alerts.delete_many(in_ledger(ledger, {"budget_id": budget_id}))
+        await analytics_cache.bump(f"budgets:{ledger}")
+        return {"message": "Budget deleted successfully"}
+    raise HTTPException(status_code=404, detail="Budget not found")
+
 # Recurring transaction routes
 @api_router.post("/recurring", response_model=RecurringTransaction)
-async def create_recurring_transaction(recurring_transaction: RecurringTransactionCreate):
+async def create_recurring_transaction(
+    recurring_transaction: RecurringTransactionCreate, ledger: str = Depends(current_ledger),
+):
+    from recurrence import FREQUENCIES, next_occurrence
+
     recurring_dict = recurring_transaction.dict()
-    # Calculate next date based on frequency
-    from datetime import datetime, timedelta
-    now = datetime.now()
-    if recurring_dict["frequency"] == "weekly":
-        next_date = (now + timedelta(weeks=1)).strftime("%Y-%m-%d")
-    elif recurring_dict["frequency"] == "monthly":
-        next_date = (now.replace(month=now.month + 1) if now.month < 12 else now.replace(year=now.year + 1, month=1)).strftime("%Y-%m-%d")
-    else:  # yearly
-        next_date = now.replace(year=now.year + 1).strftime("%Y-%m-%d")
-    
-    recurring_dict["nextDate"] = next_date
-    recurring_obj = RecurringTransaction(**recurring_dict)
+    if recurring_dict["frequency"] not in FREQUENCIES:
+        raise HTTPException(status_code=400, detail="Frequency must be weekly, monthly or yearly")
+
+    # The schedule is anchored on today; the first occurrence is one period out
+    today = date.today()
+    recurring_dict["startDate"] = today.isoformat()
+    recurring_dict["nextDate"] = next_occurrence(today, recurring_dict["frequency"], today).isoformat()
+    recurring_obj = RecurringTransaction(**recurring_dict, ledger_id=ledger)
     result = await db.recurring_transactions.insert_one(recurring_obj.dict())
     if result.inserted_id:
+        await analytics_cache.bump(f"recurring:{ledger}")
         return recurring_obj
     raise HTTPException(status_code=400, detail="Recurring transaction creation failed")
 
 @api_router.get("/recurring", response_model=List[RecurringTransaction])
-async def get_recurring_transactions():
-    recurring_transactions = await db.recurring_transactions.find().to_list(1000)
+async def get_recurring_transactions(ledger: str = Depends(current_ledger)):
+    recurring_transactions = await db.recurring_transactions.find(in_ledger(ledger)).to_list(1000)
+    record_returned(len(recurring_transactions))
     return [RecurringTransaction(**recurring_transaction_helper(rt)) for rt in recurring_transactions]
 
 @api_router.get("/recurring/{recurring_id}", response_model=RecurringTransaction)
-async def get_recurring_transaction(recurring_id: str):
-    recurring_transaction = await db.recurring_transactions.find_one({"id": recurring_id})
+async def get_recurring_transaction(recurring_id: str, ledger: str = Depends(current_ledger)):
+    recurring_transaction = await db.recurring_transactions.find_one(in_ledger(ledger, {"id": recurring_id}))
     if recurring_transaction:
         return RecurringTransaction(**recurring_transaction_helper(recurring_transaction))
     raise HTTPException(status_code=404, detail="Recurring transaction not found")
 
 @api_router.put("/recurring/{recurring_id}", response_model=RecurringTransaction)
-async def update_recurring_transaction(recurring_id: str, recurring_update: RecurringTransactionUpdate):
+async def update_recurring_transaction(
+    recurring_id: str, recurring_update: RecurringTransactionUpdate, ledger: str = Depends(current_ledger),
+):
+    from recurrence import FREQUENCIES
+
     update_data = {k: v for k, v in recurring_update.dict().items() if v is not None}
+    if update_data.get("frequency", FREQUENCIES[0]) not in FREQUENCIES:
+        raise HTTPException(status_code=400, detail="Frequency must be weekly, monthly or yearly")
     update_data["updated_at"] = datetime.utcnow()
     
     result = await db.recurring_transactions.update_one(
-        {"id": recurring_id}, 
+        in_ledger(ledger, {"id": recurring_id}),
         {"$set": update_data}
     )
     
     if result.matched_count:
-        updated_recurring = await db.recurring_transactions.find_one({"id": recurring_id})
+        await analytics_cache.bump(f"recurring:{ledger}")
+        updated_recurring = await db.recurring_transactions.find_one(in_ledger(ledger, {"id": recurring_id}))
         return RecurringTransaction(**recurring_transaction_helper(updated_recurring))
     raise HTTPException(status_code=404, detail="Recurring transaction not found")
 
 @api_router.delete("/recurring/{recurring_id}")
-async def delete_recurring_transaction(recurring_id: str):
-    result = await db.recurring_transactions.delete_one({"id": recurring_id})
+async def delete_recurring_transaction(recurring_id: str, ledger: str = Depends(current_ledger)):
+    result = await db.recurring_transactions.delete_one(in_ledger(ledger, {"id": recurring_id}))
     if result.deleted_count:
+        await analytics_cache.bump(f"recurring:{ledger}")
         return {"message": "Recurring transaction deleted successfully"}
     raise HTTPException(status_code=404, detail="Recurring transaction not found")
 
+# Recurring transaction scheduler
+def schedule_anchor(template) -> str:
+    # Templates created before startDate existed are anchored on their current nextDate
+    return template.get("startDate") or template["nextDate"]
+
+def valid_schedule(template) -> bool:
+    from recurrence import FREQUENCIES
+
+    try:
+        date.fromisoformat(schedule_anchor(template))
+        date.fromisoformat(template["nextDate"])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return template.get("frequency") in FREQUENCIES
+
+def postable(template) -> bool:
+    # Occurrences are posted as Transactions; pydantic's ValidationError is a ValueError
+    if not valid_schedule(template):
+        return False
+    try:
+        Transaction(
+            **{field: template.get(field) for field in ("type", "category", "amount", "description")},
+            date=template["nextDate"],
+        )
+    except (TypeError, ValueError):
+        return False
+    return True
+
+def occurrence_id(recurring_id: str, day: str) -> str:
+    # Deterministic ids let the unique index reject an occurrence posted twice by racing workers
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"recurring/{recurring_id}/{day}"))
+
+async def materialize_due_recurring(today: Optional[date] = None) -> int:
+    """Post every missed occurrence of every due template, in every ledger, and advance their nextDate."""
+    today = today or date.today()
+    due = await db.recurring_transactions.find({"nextDate": {"$lte": today.isoformat()}}).to_list(None)
+    templates = []
+    for template in due:
+        if postable(template):
+            templates.append(template)
+        else:
+            logger.warning("Skipping invalid recurring transaction %s", template.get("id"))
+    if not templates:
+        return 0
+    from recurrence import next_after, occurrences_between
+
+    # Expand every template's missed occurrences and its next due date in two array calls
+    anchors = [schedule_anchor(template) for template in templates]
+    frequencies = [template["frequency"] for template in templates]
+    indexes, days = occurrences_between(anchors, frequencies, [template["nextDate"] for template in templates], today)
+    next_dates = next_after(anchors, frequencies, today).astype(str)
+
+    documents = []
+    for index, day in zip(indexes.tolist(), days.astype(str).tolist()):
+        template = templates[index]
+        documents.append(transaction_to_storage(Transaction(
+            id=occurrence_id(template["id"], day),
+            ledger_id=template.get("ledger_id", DEFAULT_LEDGER),
+            type=template["type"],
+            category=template["category"],
+            amount=template["amount"],
+            description=template["description"],
+            date=day,
+        ).dict()))
+
+    # Only advance from the nextDate we read, so a concurrent tick cannot move it twice.
+    # _id keeps each update targeted once the collection is sharded.
+    advances = [
+        UpdateOne(
+            {"_id": template["_id"], "nextDate": template["nextDate"]},
+            {"$set": {"nextDate": next_date, "updated_at": datetime.utcnow()}},
+        )
+        for template, next_date in zip(templates, next_dates.tolist())
+    ]
+
+    inserted = []
+    for offset in range(0, len(documents), BULK_BATCH_SIZE):
+        batch = documents[offset:offset + BULK_BATCH_SIZE]
+        inserted += await insert_batch(db.transactions, batch, list(range(len(batch))), [])
+    await ledger_changed(added=inserted)
+    if advances:
+        await db.recurring_transactions.bulk_write(advances, ordered=False)
+        for ledger in {template.get("ledger_id", DEFAULT_LEDGER) for template in templates}:
+            await analytics_cache.bump(f"recurring:{ledger}")
+    return len(inserted)
+
+async def run_recurring_scheduler():
+    while True:
+        try:
+            posted = await materialize_due_recurring()
+            if posted:
+                logger.info("Posted %d recurring transactions", posted)
+        except Exception:
+            # One bad pass (database, cache or data error) must not end the scheduler for good
+            logger.exception("Recurring transaction scheduler pass failed")
+        await asyncio.sleep(RECURRING_SCHEDULER_INTERVAL)
+
 # Analytics routes
+async def compute_summary(ledger: str, filters: Optional[dict] = None) -> SummaryResponse:
+    pipeline = [
+        {"$match": in_ledger(ledger, filters)},
+        {"$group": {
+            "_id": None,
+            "income": {"$sum": {"$cond": [{"$eq": ["$type", "income"]}, "$amount_cents", 0]}},
+            "expenses": {"$sum": {"$cond": [{"$eq": ["$type", "expense"]}, "$amount_cents", 0]}},
+        }},
+    ]
+    result = await analytics_db.transactions.aggregate(pipeline).to_list(1)
+
+    # An empty ledger yields no group document at all
+    if not result:
+        return SummaryResponse(income=0, expenses=0, balance=0)
+    # Cents are summed exactly in the database and converted once here
+    income, expenses = result[0]["income"], result[0]["expenses"]
+    return SummaryResponse(
+        income=from_cents(income),
+        expenses=from_cents(expenses),
+        balance=from_cents(income - expenses),
+    )
+
 @api_router.get("/analytics/summary", response_model=SummaryResponse)
-async def get_summary():
-    transactions = await db.transactions.find().to_list(1000)
-    
-    income = sum(t["amount"] for t in transactions if t["type"] == "income")
-    expenses = sum(t["amount"] for t in transactions if t["type"] == "expense")
-    balance = income - expenses
-    
-    return SummaryResponse(income=income, expenses=expenses, balance=balance)
+async def get_summary(
+    request: Request, filters: dict = Depends(transaction_filter), ledger: str = Depends(current_ledger),
+):
+    return await cached_json(request, (f"transactions:{ledger}",), lambda: compute_summary(ledger, filters))
+
+@api_router.get("/analytics/forecast", response_model=ForecastResponse)
+async def get_forecast(
+    request: Request,
+    horizon: int = Query(90, ge=1, le=3660, description="Days to project forward"),
+    granularity: str = Query("day", pattern="^(day|month)$"),
+    ledger: str = Depends(current_ledger),
+):
+    # The projection starts from today, so the date is part of the cache key
+    return await cached_json(
+        request,
+        (f"transactions:{ledger}", f"recurring:{ledger}"),
+        lambda: compute_forecast(ledger, horizon, granularity),
+        date.today(),
+    )
+
+async def compute_forecast(ledger: str, horizon: int, granularity: str) -> ForecastResponse:
+    from forecast import project_balance
+
+    summary = await compute_summary(ledger)
+    templates = await analytics_db.recurring_transactions.find(
+        in_ledger(ledger),
+        {"_id": 0, "id": 1, "type": 1, "amount": 1, "frequency": 1, "nextDate": 1, "startDate": 1},
+    ).to_list(None)
+    templates = [template for template in templates if valid_schedule(template)]
+
+    labels, changes, balances = project_balance(
+        to_cents(summary.balance),
+        templates,
+        [schedule_anchor(template) for template in templates],
+        date.today(),
+        horizon,
+        granularity,
+    )
+    return ForecastResponse(
+        start_balance=summary.balance,
+        granularity=granularity,
+        points=[
+            ForecastPoint(date=label, change=change, balance=balance)
+            for label, change, balance in zip(labels, (changes / 100).tolist(), (balances / 100).tolist())
+        ],
+    )
+
+@api_router.get("/analytics/balance-series", response_model=BalanceSeriesResponse)
+async def get_balance_series(
+    request: Request,
+    granularity: str = Query("month", pattern="^(day|week|month)$"),
+    window: Optional[int] = Query(None, ge=2, le=366, description="Buckets in the rolling average of the balance"),
+    filters: dict = Depends(transaction_filter),
+    ledger: str = Depends(current_ledger),
+):
+    return await cached_json(
+        request,
+        (f"transactions:{ledger}",),
+        lambda: compute_balance_series(ledger, granularity, window, filters),
+    )
+
+async def compute_balance_series(
+    ledger: str, granularity: str, window: Optional[int], filters: dict,
+) -> BalanceSeriesResponse:
+    from balances import balance_series
+
+    sums = {
+        "income": {"$sum": {"$cond": [{"$eq": ["$type", "income"]}, "$amount_cents", 0]}},
+        "expense": {"$sum": {"$cond": [{"$eq": ["$type", "expense"]}, "$amount_cents", 0]}},
+    }
+    # The database only reduces the ledger to daily (or, from rollups, monthly) totals;
+    # bucketing, gap filling and the running sums are vectorized here
+    if granularity == "month" and not filters:
+        rows = await analytics_db.monthly_rollups.aggregate(
+            [{"$match": in_ledger(ledger, {"count": {"$gt": 0}})}, {"$group": {"_id": "$month", **sums}}]
+        ).to_list(None)
+        days = [f"{row['_id']}-01" for row in rows]
+    else:
+        rows = await analytics_db.transactions.aggregate(
+            [{"$match": in_ledger(ledger, filters)}, {"$group": {"_id": "$date", **sums}}]
+        ).to_list(None)
+        days = [row["_id"] for row in rows]
+
+    # A series that starts mid-ledger opens with the balance of everything before it
+    bounds = filters.get("date", {})
+    opening = 0
+    if "$gte" in bounds:
+        before = await compute_summary(ledger, {**filters, "date": {"$lt": bounds["$gte"]}})
+        opening = to_cents(before.balance)
+
+    labels, income, expense, balance, average = balance_series(
+        days,
+        [row["income"] for row in rows],
+        [row["expense"] for row in rows],
+        granularity,
+        opening,
+        window,
+        bounds["$gte"].date() if "$gte" in bounds else None,
+        bounds["$lte"].date() if "$lte" in bounds else None,
+    )
+    averages = (average / 100).round(2).tolist() if average is not None else [None] * len(labels)
+    return BalanceSeriesResponse(
+        granularity=granularity,
+        opening_balance=from_cents(opening),
+        points=[
+            BalancePoint(date=label, income=point_income, expense=point_expense, balance=point_balance, average=point_average)
+            for label, point_income, point_expense, point_balance, point_average in zip(
+                labels, (income / 100).tolist(), (expense / 100).tolist(), (balance / 100).tolist(), averages,
+            )
+        ],
+    )
 
 @api_router.get("/analytics/categories", response_model=List[CategoryBreakdown])
-async def get_category_breakdown():
-    transactions = await db.transactions.find().to_list(1000)
-    
-    categories = {}
-    for transaction in transactions:
-        category = transaction["category"]
-        if category not in categories:
-            categories[category] = {"income": 0, "expense": 0}
-        categories[category][transaction["type"]] += transaction["amount"]
-    
+async def get_category_breakdown(
+    request: Request, filters: dict = Depends(transaction_filter), ledger: str = Depends(current_ledger),
+):
+    return await cached_json(
+        request, (f"transactions:{ledger}",), lambda: compute_category_breakdown(ledger, filters),
+    )
+
+async def compute_category_breakdown(ledger: str, filters: Optional[dict] = None) -> List[CategoryBreakdown]:
+    group = {"$group": {
+        "_id": "$category",
+        "income": {"$sum": {"$cond": [{"$eq": ["$type", "income"]}, "$amount_cents", 0]}},
+        "expense": {"$sum": {"$cond": [{"$eq": ["$type", "expense"]}, "$amount_cents", 0]}},
+    }}
+    # Unfiltered reads use monthly_rollups, so cost grows with months x categories rather than rows.
+    # Arbitrary date or amount bounds need the ledger itself, narrowed by the indexed $match.
+    if filters:
+        categories = await analytics_db.transactions.aggregate(
+            [{"$match": in_ledger(ledger, filters)}, group]
+        ).to_list(None)
+    else:
+        categories = await analytics_db.monthly_rollups.aggregate(
+            [{"$match": in_ledger(ledger, {"count": {"$gt": 0}})}, group]
+        ).to_list(None)
     return [
         CategoryBreakdown(
-            category=category,
-            income=data["income"],
-            expense=data["expense"]
+            category=data["_id"],
+            income=from_cents(data["income"]),
+            expense=from_cents(data["expense"])
         )
-        for category, data in categories.items()
+        for data in categories
     ]
 
+@api_router.get("/analytics/monthly", response_model=List[MonthlyBreakdown])
+async def get_monthly_breakdown(
+    request: Request,
+    start_month: Optional[str] = Query(None, pattern=MONTH_PATTERN),
+    end_month: Optional[str] = Query(None, pattern=MONTH_PATTERN),
+    ledger: str = Depends(current_ledger),
+):
+    return await cached_json(
+        request,
+        (f"transactions:{ledger}",),
+        lambda: compute_monthly_breakdown(ledger, start_month, end_month),
+    )
+
+async def compute_monthly_breakdown(
+    ledger: str, start_month: Optional[str], end_month: Optional[str],
+) -> List[MonthlyBreakdown]:
+    match = in_ledger(ledger, {"count": {"$gt": 0}})
+    if start_month or end_month:
+        match["month"] = {}
+        if start_month:
+            match["month"]["$gte"] = start_month
+        if end_month:
+            match["month"]["$lte"] = end_month
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"month": "$month", "category": "$category"},
+            "income": {"$sum": {"$cond": [{"$eq": ["$type", "income"]}, "$amount_cents", 0]}},
+            "expense": {"$sum": {"$cond": [{"$eq": ["$type", "expense"]}, "$amount_cents", 0]}},
+        }},
+        {"$sort": {"_id.month": 1, "_id.category": 1}},
+    ]
+    months = await analytics_db.monthly_rollups.aggregate(pipeline).to_list(None)
+    return [
+        MonthlyBreakdown(
+            month=data["_id"]["month"],
+            category=data["_id"]["category"],
+            income=from_cents(data["income"]),
+            expense=from_cents(data["expense"])
+        )
+        for data in months
+    ]
+
+@api_router.get("/analytics/anomalies", response_model=AnomalyReport)
+async def get_anomalies(
+    request: Request,
+    window_days: int = Query(3, ge=0, le=31, description="Days apart that still count as a duplicate posting"),
+    method: str = Query("iqr", pattern="^(iqr|zscore)$"),
+    threshold: Optional[float] = Query(None, gt=0, description="Outlier score cut-off; 1.5 for iqr, 3 for zscore"),
+    filters: dict = Depends(transaction_filter),
+    ledger: str = Depends(current_ledger),
+):
+    return await cached_json(
+        request,
+        (f"transactions:{ledger}",),
+        lambda: compute_anomalies(ledger, window_days, method, threshold, filters),
+    )
+
+async def compute_anomalies(
+    ledger: str, window_days: int = 3, method: str = "iqr", threshold: Optional[float] = None, filters: Optional[dict] = None,
+) -> AnomalyReport:
+    """Find repeated postings and per-category amount outliers across a ledger."""
+    import numpy as np
+    from anomalies import DEFAULT_THRESHOLDS, duplicate_groups, outlier_scores, pair_codes
+
+    # The ledger is read once into columns, a batch at a time; only the rows that end up
+    # in the report are read again, by id, for their descriptions
+    columns = defaultdict(list)
+    categories = {}  # (type, category) -> code
+    cursor = analytics_db.transactions.aggregate([
+        {"$match": in_ledger(ledger, filters)},
+        {"$project": {
+            "_id": 0, "id": 1, "date": 1, "amount_cents": 1, "amount": 1, "type": 1, "category": 1,
+            # Only rows written before search_terms existed send their description
+            "terms": {"$ifNull": ["$search_terms", "$description"]},
+        }},
+    ], batchSize=ANOMALY_BATCH_SIZE)
+    batch = []
+    async for transaction in cursor:
+        batch.append(transaction)
+        if len(batch) >= ANOMALY_BATCH_SIZE:
+            for name, values in anomaly_columns(batch, categories).items():
+                columns[name].append(values)
+            batch = []
+    for name, values in anomaly_columns(batch, categories).items():
+        columns[name].append(values)
+    ids, days, amounts, term_hashes, category_keys = (
+        np.concatenate(columns[name]) for name in ("ids", "days", "amounts", "term_hashes", "category_keys")
+    )
+    kinds = list(categories)  # codes are assigned in insertion order
+
+    # Same type and amount with the same description words, in any case or punctuation
+    # (the words' hash is taken with the type, so equal codes mean all three match)
+    groups = duplicate_groups(pair_codes(term_hashes, amounts), days, window_days)
+    groups.sort(key=lambda rows: int(days[rows].max()), reverse=True)
+
+    scores, typical = outlier_scores(category_keys, amounts, method) if len(ids) else (np.zeros(0), np.zeros(0))
+    flagged = np.flatnonzero(np.abs(scores) > (threshold or DEFAULT_THRESHOLDS[method]))
+    flagged = flagged[np.argsort(-np.abs(scores[flagged]), kind="stable")]
+
+    reported_groups, reported_flagged = groups[:ANOMALY_REPORT_LIMIT], flagged[:ANOMALY_REPORT_LIMIT].tolist()
+    reported = {ids[row].decode() for rows in reported_groups for row in rows.tolist()}
+    reported |= {ids[row].decode() for row in reported_flagged}
+    descriptions = {}
+    async for transaction in analytics_db.transactions.find(
+        in_ledger(ledger, {"id": {"$in": sorted(reported)}}), {"_id": 0, "id": 1, "description": 1},
+    ):
+        descriptions[transaction["id"]] = transaction["description"]
+
+    def day(row: int) -> str:
+        return str(np.datetime64(int(days[row]), "D"))
+
+    duplicates = []
+    for rows in reported_groups:
+        rows = rows.tolist()
+        duplicates.append(DuplicateGroup(
+            exact=bool(days[rows].min() == days[rows].max()),
+            type=kinds[category_keys[rows[0]]][0],
+            amount=from_cents(int(amounts[rows[0]])),
+            description=descriptions.get(ids[rows[0]].decode(), ""),
+            dates=[day(row) for row in rows],
+            ids=[ids[row].decode() for row in rows],
+        ))
+
+    return AnomalyReport(
+        scanned=len(ids),
+        duplicate_groups=len(groups),
+        outlier_count=len(flagged),
+        duplicates=duplicates,
+        outliers=[
+            Outlier(
+                id=ids[row].decode(),
+                date=day(row),
+                type=kinds[category_keys[row]][0],
+                category=kinds[category_keys[row]][1],
+                amount=from_cents(int(amounts[row])),
+                description=descriptions.get(ids[row].decode(), ""),
+                score=round(float(scores[row]), 2),
+                typical=round(float(typical[row]) / 100, 2),
+            )
+            for row in reported_flagged
+        ],
+    )
+
+def description_terms(terms) -> list:
+    # Either the stored search_terms or, for rows that predate them, the description itself
+    return terms if isinstance(terms, list) else search_terms(terms or "")
+
+def anomaly_columns(batch: List[dict], categories: dict) -> dict:
+    """NumPy columns of one cursor batch; `categories` carries the category codes from batch to batch."""
+    import numpy as np
+    from anomalies import group_codes
+
+    return {
+        "ids": np.array([transaction["id"].encode() for transaction in batch], dtype="S"),
+        "days": np.asarray([transaction["date"] for transaction in batch], dtype="datetime64[D]").astype(np.int64),
+        "amounts": np.fromiter(
+            (transaction["amount_cents"] if "amount_cents" in transaction else to_cents(transaction["amount"]) for transaction in batch),
+            dtype=np.int64, count=len(batch),
+        ),
+        # One 64-bit hash per row of its type and description words stands in for the words themselves
+        "term_hashes": np.fromiter(
+            (
+                hash((transaction["type"], tuple(description_terms(transaction.get("terms")))))
+                for transaction in batch
+            ),
+            dtype=np.int64, count=len(batch),
+        ),
+        "category_keys": group_codes(((transaction["type"], transaction["category"]) for transaction in batch), categories),
+    }
+
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.exception_handler(RequestValidationError)
+async def validation_error_handler(request: Request, exc: RequestValidationError):
+    # Errors echo the rejected input; orjson writes a NaN or Infinity there as null instead of failing
+    return ORJSONResponse(status_code=422, content={"detail": jsonable_encoder(exc.errors())})
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Next-Offset", "ETag", "Last-Modified"],
 )
+app.add_middleware(MetricsMiddleware)
+
+# Prometheus scrape target; served outside /api so it is never proxied to browsers
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 # Configure logging
 logging.basicConfig(
@@ -266,6 +1478,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+async def provision_database():
+    # Warm the pool and verify indexes before the first request is served
+    try:
+        await database.warm_up()
+        await ensure_indexes(db)
+        legacy = await count_legacy_transactions(db)
+        if legacy:
+            logger.warning("%d transactions use the legacy storage format; run `python migrations.py`", legacy)
+        await ensure_rollups(db)
+        await ensure_category_terms(db)
+    except PyMongoError:
+        logger.exception("Database provisioning failed; continuing without it")
@@ -0,0 +1,72 @@
+"""Conversion between the API shape of a transaction and its stored form.
+
+The API keeps exchanging `date` as a YYYY-MM-DD string and `amount` as a
+float. In MongoDB the date is a native BSON date (midnight UTC) and the
+amount is an Int64 number of cents in `amount_cents`. That gives range
+scans real date ordering and makes $sum exact.
+
+Every stored document also carries the `ledger_id` of the tenant it belongs
+to. Data written before ledgers existed is assigned to DEFAULT_LEDGER.
+Transactions additionally store the normalized `search_terms` of their
+description (see search.py). Counts derived from those terms (the search
+vocabulary, the categorizer's term counts) skip rows written before the
+field existed, on removal as well as on insert, since those rows were never
+counted in the first place.
+"""
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+
+from bson import Int64
+
+from search import search_terms
+
+DATE_FORMAT = "%Y-%m-%d"
+DEFAULT_LEDGER = "default"
+# Rows nobody categorized; the categorizer fills these in when it can
+DEFAULT_CATEGORY = "Uncategorized"
+
+
+def to_cents(amount) -> Int64:
+    return Int64((Decimal(str(amount)) * 100).to_integral_value(ROUND_HALF_UP))
+
+
+def from_cents(cents) -> float:
+    return cents / 100
+
+
+def to_storage_date(value) -> datetime:
+    """Parse an ISO date (or datetime) string into a midnight datetime; raises ValueError."""
+    if isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    parsed = datetime.fromisoformat(str(value).strip())
+    return datetime(parsed.year, parsed.month, parsed.day)
+
+
+def from_storage_date(value) -> str:
+    return value.strftime(DATE_FORMAT) if isinstance(value, datetime) else value
+
+
+def transaction_to_storage(transaction: dict) -> dict:
+    """Convert a full or partial API-shaped transaction dict to its stored form."""
+    stored = dict(transaction)
+    if "amount" in stored:
+        stored["amount_cents"] = to_cents(stored.pop("amount"))
+    if "date" in stored:
+        stored["date"] = to_storage_date(stored["date"])
+    if "description" in stored:
+        stored["search_terms"] = search_terms(stored["description"])
+    return stored
+
+
+def stored_amount(transaction: dict) -> float:
+    # Documents not yet migrated still carry the legacy float `amount`
+    if "amount_cents" in transaction:
+        return from_cents(transaction["amount_cents"])
+    return transaction["amount"]
+
+
+def as_stored(transaction: dict) -> dict:
+    """Return the stored form of a document, converting legacy rows read before migration."""
+    if "amount_cents" in transaction and isinstance(transaction.get("date"), datetime):
+        return transaction
+    return transaction_to_storage({**transaction, "amount": stored_amount(transaction)})
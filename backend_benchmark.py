@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""Load-test and benchmark harness for the Budget Planner API.
+
+Seeds synthetic ledgers of the requested sizes. It then drives concurrent
+async traffic against the CRUD and analytics routes and writes
+p50/p95/p99 latency and throughput per operation as JSON.
+
+By default the app runs in-process against the MongoDB in backend/.env,
+using a separate `budget_benchmark` database. --mongomock swaps in an
+in-memory stand-in (needs mongomock-motor). --url drives a running server
+instead. Use a dedicated database there: the ledger and its recurring
+transactions are wiped between sizes.
+
+    python backend_benchmark.py --sizes 10000 100000 1000000 --output bench.json
+    python backend_benchmark.py --sizes 10000 --compare bench.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import httpx
+
+ROOT_DIR = Path(__file__).parent
+BENCHMARK_DB = "budget_benchmark"
+SEED_BATCH_SIZE = 5000
+INCOME_CATEGORIES = ["Salary", "Freelance", "Investment", "Business", "Other"]
+EXPENSE_CATEGORIES = ["Food", "Transportation", "Entertainment", "Bills", "Healthcare", "Shopping", "Other"]
+
+# Relative weights of each operation in the generated traffic
+OPERATION_WEIGHTS = {
+    "list": 20,
+    "list_month": 15,
+    "get": 15,
+    "create": 8,
+    "update": 6,
+    "delete": 4,
+    "summary": 12,
+    "categories": 10,
+    "monthly": 5,
+    "forecast": 5,
+}
+
+
+def synthetic_transaction(rng: random.Random, start: date, span_days: int) -> dict:
+    if rng.random() < 0.2:
+        transaction_type, category = "income", rng.choice(INCOME_CATEGORIES)
+        amount = round(rng.uniform(100, 5000), 2)
+    else:
+        transaction_type, category = "expense", rng.choice(EXPENSE_CATEGORIES)
+        amount = round(rng.lognormvariate(3, 1), 2)
+    return {
+        "type": transaction_type,
+        "category": category,
+        "amount": amount,
+        "description": f"{category} #{rng.randint(1, 500)}",
+        "date": (start + timedelta(days=rng.randrange(span_days))).isoformat(),
+    }
+
+
+async def create_client(args):
+    """Return (httpx client, reset coroutine) for the selected target."""
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url.rstrip("/"), timeout=args.timeout)
+
+        async def reset():
+            # seed() adds recurring templates for each size; they would pile up in the forecast otherwise
+            await client.delete("/transactions/bulk", params={"start_date": "1900-01-01"})
+            response = await client.get("/recurring")
+            response.raise_for_status()
+            for template in response.json():
+                await client.delete(f"/recurring/{template['id']}")
+        return client, reset
+
+    os.environ["DB_NAME"] = args.db_name
+    os.environ["RECURRING_SCHEDULER_INTERVAL"] = "0"
+    if not args.cache:
+        os.environ["ANALYTICS_CACHE_TTL"] = "0"
+    sys.path.insert(0, str(ROOT_DIR / "backend"))
+    import server
+    from indexes import INDEXES, ensure_indexes
+
+    if args.mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+
+        server.db = server.analytics_db = AsyncMongoMockClient()[args.db_name]
+
+    async def reset():
+        # Every indexed collection holds counts derived from the ledger, so all start empty for each size
+        for name in INDEXES:
+            await server.db[name].drop()
+        server.categorizer.models.clear()
+        await ensure_indexes(server.db)
+
+    transport = httpx.ASGITransport(app=server.app)
+    client = httpx.AsyncClient(transport=transport, base_url="http://benchmark/api", timeout=args.timeout)
+    return client, reset
+
+
+async def seed(client, size: int, rng: random.Random) -> float:
+    start = date.today() - timedelta(days=3 * 365)
+    began = time.perf_counter()
+    for offset in range(0, size, SEED_BATCH_SIZE):
+        rows = [synthetic_transaction(rng, start, 3 * 365) for _ in range(min(SEED_BATCH_SIZE, size - offset))]
+        body = "\n".join(json.dumps(row) for row in rows)
+        response = await client.post(
+            "/transactions/bulk",
+            content=body,
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        response.raise_for_status()
+    for frequency in ("weekly", "monthly", "yearly"):
+        await client.post("/recurring", json={
+            "type": "expense", "category": "Bills", "amount": 42.5,
+            "description": f"{frequency} bill", "frequency": frequency,
+        })
+    return time.perf_counter() - began
+
+
+class Workload:
+    def __init__(self, client, rng: random.Random, ids: list):
+        self.client = client
+        self.rng = rng
+        self.ids = ids
+        self.created = []
+
+    def random_month(self) -> tuple:
+        day = date.today() - timedelta(days=self.rng.randrange(3 * 365))
+        first = day.replace(day=1)
+        last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        return first.isoformat(), last.isoformat()
+
+    async def run(self, operation: str):
+        client, rng = self.client, self.rng
+        if operation == "list":
+            return await client.get("/transactions", params={"limit": 100})
+        if operation == "list_month":
+            start, end = self.random_month()
+            return await client.get("/transactions", params={"start_date": start, "end_date": end})
+        if operation == "get":
+            return await client.get(f"/transactions/{rng.choice(self.ids)}")
+        if operation == "create":
+            row = synthetic_transaction(rng, date.today() - timedelta(days=365), 365)
+            response = await client.post("/transactions", json=row)
+            if response.status_code == 200:
+                self.created.append(response.json()["id"])
+            return response
+        if operation == "update":
+            return await client.put(f"/transactions/{rng.choice(self.ids)}", json={"description": "benchmark update"})
+        if operation == "delete":
+            if not self.created:
+                return await client.get(f"/transactions/{rng.choice(self.ids)}")
+            return await client.delete(f"/transactions/{self.created.pop()}")
+        if operation == "summary":
+            return await client.get("/analytics/summary")
+        if operation == "categories":
+            return await client.get("/analytics/categories")
+        if operation == "monthly":
+            return await client.get("/analytics/monthly")
+        if operation == "forecast":
+            return await client.get("/analytics/forecast", params={"horizon": 365})
+        raise ValueError(operation)
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+async def drive(workload: Workload, total: int, concurrency: int, rng: random.Random) -> dict:
+    operations = rng.choices(list(OPERATION_WEIGHTS), weights=list(OPERATION_WEIGHTS.values()), k=total)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    queue = iter(operations)
+
+    async def worker():
+        for operation in queue:
+            began = time.perf_counter()
+            try:
+                response = await workload.run(operation)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies[operation].append(time.perf_counter() - began)
+            errors[operation] += failed
+
+    began = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - began
+
+    results = {operation: summarize(latencies[operation], errors[operation], elapsed) for operation in sorted(latencies)}
+    all_latencies = [value for values in latencies.values() for value in values]
+    results["overall"] = summarize(all_latencies, sum(errors.values()), elapsed)
+    return results
+
+
+async def benchmark(args) -> dict:
+    client, reset = await create_client(args)
+    report = {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(),
+            "target": args.url or ("mongomock" if args.mongomock else f"in-process:{args.db_name}"),
+            "python": platform.python_version(),
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "seed": args.seed,
+            "analytics_cache": args.cache,
+        },
+        "results": [],
+    }
+    async with client:
+        for size in args.sizes:
+            rng = random.Random(args.seed)
+            await reset()
+            print(f"Seeding {size} transactions...")
+            seed_seconds = await seed(client, size, rng)
+            response = await client.get("/transactions", params={"fields": "id", "limit": 1000})
+            ids = [row["id"] for row in response.json()]
+            print(f"Driving {args.requests} requests at concurrency {args.concurrency}...")
+            operations = await drive(Workload(client, rng, ids), args.requests, args.concurrency, rng)
+            report["results"].append({
+                "size": size,
+                "seed_seconds": round(seed_seconds, 3),
+                "seed_rows_per_second": round(size / seed_seconds, 1) if seed_seconds else 0.0,
+                "operations": operations,
+            })
+            overall = operations["overall"]
+            print(f"  p50 {overall['p50_ms']}ms  p95 {overall['p95_ms']}ms  p99 {overall['p99_ms']}ms  "
+                  f"{overall['throughput_rps']} req/s  {overall['errors']} errors")
+    return report
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """p95 regressions beyond tolerance, matched by ledger size and operation."""
+    regressions = []
+    previous = {result["size"]: result["operations"] for result in baseline["results"]}
+    for result in report["results"]:
+        for operation, stats in result["operations"].items():
+            old = previous.get(result["size"], {}).get(operation)
+            if not old or not old["p95_ms"]:
+                continue
+            change = (stats["p95_ms"] - old["p95_ms"]) / old["p95_ms"]
+            if change > tolerance:
+                regressions.append(
+                    f"size={result['size']} {operation}: p95 {old['p95_ms']}ms -> {stats['p95_ms']}ms (+{change:.0%})"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--requests", type=int, default=2000, help="requests per ledger size")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--url", help="drive a running server, e.g. http://localhost:8001/api")
+    parser.add_argument("--db-name", default=BENCHMARK_DB)
+    parser.add_argument("--mongomock", action="store_true", help="use an in-memory MongoDB stand-in")
+    parser.add_argument("--cache", action="store_true", help="leave the analytics response cache enabled")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON report to check for p95 regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown, as a fraction")
+    args = parser.parse_args()
+
+    # Per-request client logging would dominate the output
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    report = asyncio.run(benchmark(args))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        regressions = compare(report, json.loads(Path(args.compare).read_text()), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -54,10 +54,9 @@ class BudgetPlannerAPITest(unittest.TestCase):
     def clean_test_data(self):
         # Get all transactions and delete them
         response = requests.get(f"{BACKEND_URL}/transactions")
-        if response.status_code == 200:
-            transactions = response.json()
-            for transaction in transactions:
-                requests.delete(f"{BACKEND_URL}/transactions/{transaction['id']}")
+        if response.status_code == 200 and response.json():
+            ids = [transaction["id"] for transaction in response.json()]
+            requests.delete(f"{BACKEND_URL}/transactions/bulk", params={"ids": ids})
         
         # Get all recurring transactions and delete them
         response = requests.get(f"{BACKEND_URL}/recurring")
@@ -135,6 +134,113 @@ class BudgetPlannerAPITest(unittest.TestCase):
         response = requests.delete(f"{BACKEND_URL}/transactions/{non_existent_id}")
         self.assertEqual(response.status_code, 404)
     
+    def test_bulk_transaction_ingest(self):
+        # Test 1: JSON array with one invalid row
+        print("Testing bulk transaction ingest...")
+        rows = [self.test_transaction, {"type": "expense"}, self.test_expense]
+        response = requests.post(f"{BACKEND_URL}/transactions/bulk", json=rows)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result["inserted"], 2)
+        self.assertEqual(len(result["errors"]), 1)
+        self.assertEqual(result["errors"][0]["index"], 1)
+        
+        # Test 2: NDJSON body
+        print("Testing bulk NDJSON ingest...")
+        body = "\n".join(json.dumps(row) for row in [self.test_transaction, self.test_expense])
+        response = requests.post(f"{BACKEND_URL}/transactions/bulk", data=body,
+                                 headers={"Content-Type": "application/x-ndjson"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["inserted"], 2)
+        
+        response = requests.get(f"{BACKEND_URL}/transactions")
+        self.assertEqual(len(response.json()), 4)
+    
+    def test_bulk_update_and_delete(self):
+        print("Testing bulk update and delete...")
+        requests.post(f"{BACKEND_URL}/transactions/bulk", json=[self.test_expense, self.test_expense, self.test_transaction])
+        
+        # Test 1: Update every Groceries row in one request
+        response = requests.patch(f"{BACKEND_URL}/transactions/bulk", params={"category": "Groceries"},
+                                  json={"category": "Food"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([t["category"] for t in response.json()], ["Food", "Food"])
+        
+        # Test 2: An empty selection is rejected
+        response = requests.delete(f"{BACKEND_URL}/transactions/bulk")
+        self.assertEqual(response.status_code, 400)
+        
+        # Test 3: Delete by filter
+        response = requests.delete(f"{BACKEND_URL}/transactions/bulk", params={"category": "Food"})
+        self.assertEqual(response.json()["deleted"], 2)
+        response = requests.get(f"{BACKEND_URL}/transactions")
+        self.assertEqual(len(response.json()), 1)
+    
+    def test_transaction_filters(self):
+        print("Testing transaction filters...")
+        old_expense = self.test_expense.copy()
+        old_expense["date"] = "2020-01-15"
+        requests.post(f"{BACKEND_URL}/transactions", json=self.test_transaction)
+        requests.post(f"{BACKEND_URL}/transactions", json=self.test_expense)
+        requests.post(f"{BACKEND_URL}/transactions", json=old_expense)
+        
+        # Test 1: Date range
+        params = {"start_date": "2020-01-01", "end_date": "2020-12-31"}
+        response = requests.get(f"{BACKEND_URL}/transactions", params=params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([t["date"] for t in response.json()], ["2020-01-15"])
+        
+        # Test 2: Type and category
+        params = {"type": "expense", "category": "Groceries"}
+        response = requests.get(f"{BACKEND_URL}/transactions", params=params)
+        self.assertEqual(len(response.json()), 2)
+        
+        # Test 3: Filtered summary
+        response = requests.get(f"{BACKEND_URL}/analytics/summary", params={"min_amount": 1000})
+        self.assertEqual(response.json()["income"], 2500.00)
+        self.assertEqual(response.json()["expenses"], 0)
+
+        # Test 4: Impossible dates and non-finite amounts are rejected, not 500s
+        for params in ({"start_date": "2024-02-30"}, {"end_date": "2024-13-01"}, {"min_amount": "1e400"}):
+            response = requests.get(f"{BACKEND_URL}/transactions", params=params)
+            self.assertEqual(response.status_code, 422, params)
+        response = requests.post(f"{BACKEND_URL}/transactions",
+                                 data='{"type": "expense", "category": "Food", "amount": Infinity, '
+                                      '"description": "x", "date": "2024-01-01"}',
+                                 headers={"Content-Type": "application/json"})
+        self.assertEqual(response.status_code, 422)
+    
+    def test_ledger_isolation(self):
+        print("Testing ledger isolation...")
+        other_ledger = {"X-Ledger-Id": f"test-{uuid.uuid4().hex[:8]}"}
+        requests.post(f"{BACKEND_URL}/transactions", json=self.test_transaction)
+        response = requests.post(f"{BACKEND_URL}/transactions", json=self.test_expense, headers=other_ledger)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["ledger_id"], other_ledger["X-Ledger-Id"])
+        other_id = response.json()["id"]
+        
+        try:
+            # Test 1: Rows are only visible inside their own ledger
+            response = requests.get(f"{BACKEND_URL}/transactions")
+            self.assertNotIn(other_id, [t["id"] for t in response.json()])
+            response = requests.get(f"{BACKEND_URL}/transactions/{other_id}")
+            self.assertEqual(response.status_code, 404)
+            response = requests.get(f"{BACKEND_URL}/transactions/{other_id}", headers=other_ledger)
+            self.assertEqual(response.status_code, 200)
+            
+            # Test 2: Analytics are computed per ledger
+            response = requests.get(f"{BACKEND_URL}/analytics/summary", headers=other_ledger)
+            self.assertEqual(response.json()["income"], 0)
+            self.assertEqual(response.json()["expenses"], 150.75)
+            response = requests.get(f"{BACKEND_URL}/analytics/summary")
+            self.assertEqual(response.json()["expenses"], 0)
+            
+            # Test 3: Invalid ledger ids are rejected
+            response = requests.get(f"{BACKEND_URL}/transactions", headers={"X-Ledger-Id": "not a ledger"})
+            self.assertEqual(response.status_code, 422)
+        finally:
+            requests.delete(f"{BACKEND_URL}/transactions/{other_id}", headers=other_ledger)
+    
     # Recurring Transaction CRUD API Tests
     def test_recurring_transaction_crud(self):
         # Test 1: Create a recurring transaction
@@ -251,6 +357,108 @@ class BudgetPlannerAPITest(unittest.TestCase):
         self.assertEqual(response.status_code, 404)
     
     # Analytics API Tests
+    def test_transaction_search(self):
+        print("Testing transaction search...")
+        requests.post(f"{BACKEND_URL}/transactions", json=self.test_transaction)  # "Monthly salary payment"
+        requests.post(f"{BACKEND_URL}/transactions", json=self.test_expense)      # "Weekly grocery shopping"
+        
+        # Test 1: Exact, prefix and misspelled words all find the row
+        for query in ("grocery", "groc", "grocrey", "Weekly Grocery"):
+            response = requests.get(f"{BACKEND_URL}/transactions/search", params={"q": query})
+            self.assertEqual(response.status_code, 200)
+            results = response.json()
+            self.assertEqual([t["description"] for t in results], [self.test_expense["description"]], query)
+            self.assertGreater(results[0]["score"], 0)
+        
+        # Test 2: Filters narrow the results
+        response = requests.get(f"{BACKEND_URL}/transactions/search", params={"q": "grocery", "type": "income"})
+        self.assertEqual(response.json(), [])
+        
+        # Test 3: Unknown words match nothing and an empty query is rejected
+        response = requests.get(f"{BACKEND_URL}/transactions/search", params={"q": "grocery xylophone"})
+        self.assertEqual(response.json(), [])
+        response = requests.get(f"{BACKEND_URL}/transactions/search", params={"q": ""})
+        self.assertEqual(response.status_code, 422)
+
+    def test_transaction_export(self):
+        print("Testing columnar transaction export...")
+        requests.post(f"{BACKEND_URL}/transactions", json=self.test_transaction)
+        requests.post(f"{BACKEND_URL}/transactions", json=self.test_expense)
+
+        # Test 1: Parquet is the default format
+        response = requests.get(f"{BACKEND_URL}/transactions/export")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/vnd.apache.parquet")
+        self.assertTrue(response.content.startswith(b"PAR1") and response.content.endswith(b"PAR1"))
+
+        # Test 2: Arrow IPC files accept the transaction filters
+        response = requests.get(f"{BACKEND_URL}/transactions/export", params={"format": "arrow", "type": "expense"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b"ARROW1") and response.content.endswith(b"ARROW1"))
+
+        # Test 3: Unknown formats are rejected
+        response = requests.get(f"{BACKEND_URL}/transactions/export", params={"format": "csv"})
+        self.assertEqual(response.status_code, 422)
+
+    def test_auto_categorization(self):
+        print("Testing automatic categorization...")
+        training = [self.test_expense] * 8 + [
+            {**self.test_expense, "category": "Transport", "description": "Fuel for the car"},
+            {**self.test_expense, "category": "Transport", "description": "Train ticket"},
+        ]
+        response = requests.post(f"{BACKEND_URL}/transactions/bulk", json=training)
+        self.assertEqual(response.json()["inserted"], 10)
+        
+        # Test 1: Suggestions are ranked by confidence
+        response = requests.get(f"{BACKEND_URL}/categories/suggest", params={"description": "grocery shopping"})
+        self.assertEqual(response.status_code, 200)
+        suggestions = response.json()
+        self.assertEqual(suggestions[0]["category"], "Groceries")
+        self.assertGreater(suggestions[0]["confidence"], suggestions[-1]["confidence"])
+        
+        # Test 2: A transaction created without a category gets one
+        uncategorized = {k: v for k, v in self.test_expense.items() if k != "category"}
+        response = requests.post(f"{BACKEND_URL}/transactions", json=uncategorized)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["category"], "Groceries")
+        
+        # Test 3: Descriptions the model knows nothing about stay uncategorized
+        response = requests.post(f"{BACKEND_URL}/transactions", json={**uncategorized, "description": "zzz"})
+        self.assertEqual(response.json()["category"], "Uncategorized")
+    
+    def test_budgets(self):
+        print("Testing budgets...")
+        requests.post(f"{BACKEND_URL}/transactions", json=self.test_expense)  # Groceries: 150.75
+        response = requests.post(f"{BACKEND_URL}/budgets", json={"category": "Groceries", "limit": 200.00})
+        self.assertEqual(response.status_code, 200)
+        budget_id = response.json()["id"]
+        self.assertEqual(response.json()["alert_thresholds"], [80, 100])
+        
+        try:
+            # Test 1: One budget per category
+            response = requests.post(f"{BACKEND_URL}/budgets", json={"category": "Groceries", "limit": 50.00})
+            self.assertEqual(response.status_code, 409)
+            
+            # Test 2: Status reports the current month's spend against the limit
+            response = requests.get(f"{BACKEND_URL}/budgets/status")
+            self.assertEqual(response.status_code, 200)
+            status = next(s for s in response.json() if s["budget_id"] == budget_id)
+            self.assertEqual(status["month"], self.test_expense["date"][:7])
+            self.assertEqual(status["spent"], 150.75)
+            self.assertEqual(status["remaining"], 200.00 - 150.75)
+            self.assertIsNone(status["alert"])
+            
+            # Test 3: Crossing a threshold raises an alert once
+            requests.post(f"{BACKEND_URL}/transactions", json=self.test_expense)  # 301.50 spent
+            status = next(s for s in requests.get(f"{BACKEND_URL}/budgets/status").json() if s["budget_id"] == budget_id)
+            self.assertEqual(status["alert"], 100)
+            self.assertGreater(status["percent"], 100)
+            alerts = [a for a in requests.get(f"{BACKEND_URL}/budgets/alerts").json() if a["budget_id"] == budget_id]
+            self.assertEqual(sorted(a["threshold"] for a in alerts), [80, 100])
+        finally:
+            response = requests.delete(f"{BACKEND_URL}/budgets/{budget_id}")
+            self.assertEqual(response.status_code, 200)
+    
     def test_analytics_summary(self):
         print("Testing analytics summary...")
         # Create test transactions
@@ -300,7 +508,85 @@ class BudgetPlannerAPITest(unittest.TestCase):
         self.assertEqual(groceries_category["income"], 0)
         self.assertEqual(groceries_category["expense"], 150.75 + 75.25)
     
+    def test_analytics_balance_series(self):
+        print("Testing analytics balance series...")
+        requests.post(f"{BACKEND_URL}/transactions", json=self.test_transaction)  # Income: 2500
+        earlier_expense = self.test_expense.copy()
+        earlier_expense["date"] = (datetime.now() - timedelta(days=2)).strftime("%Y-%m-%d")
+        requests.post(f"{BACKEND_URL}/transactions", json=earlier_expense)       # Expense: 150.75
+        
+        # Test 1: One point per day, running balance ends at the summary balance
+        response = requests.get(f"{BACKEND_URL}/analytics/balance-series", params={"granularity": "day", "window": 2})
+        self.assertEqual(response.status_code, 200)
+        series = response.json()
+        self.assertEqual(len(series["points"]), 3)  # The empty day in between is filled in
+        self.assertEqual([p["balance"] for p in series["points"]], [-150.75, -150.75, 2500.00 - 150.75])
+        self.assertEqual(series["points"][-1]["average"], round((-150.75 + 2500.00 - 150.75) / 2, 2))
+        
+        # Test 2: A start date carries the earlier balance as the opening balance
+        response = requests.get(
+            f"{BACKEND_URL}/analytics/balance-series",
+            params={"granularity": "day", "start_date": self.test_transaction["date"]},
+        )
+        self.assertEqual(response.json()["opening_balance"], -150.75)
+        self.assertEqual(response.json()["points"][0]["balance"], 2500.00 - 150.75)
+        
+        # Test 3: Unknown granularities are rejected
+        response = requests.get(f"{BACKEND_URL}/analytics/balance-series", params={"granularity": "year"})
+        self.assertEqual(response.status_code, 422)
+    
+    def test_analytics_forecast(self):
+        print("Testing analytics forecast...")
+        requests.post(f"{BACKEND_URL}/transactions", json=self.test_transaction)  # Income: 2500
+        requests.post(f"{BACKEND_URL}/recurring", json=self.test_recurring)
+        
+        # Test 1: Recurring templates move the projected balance
+        response = requests.get(f"{BACKEND_URL}/analytics/forecast", params={"horizon": 45})  # one monthly occurrence
+        self.assertEqual(response.status_code, 200)
+        forecast = response.json()
+        self.assertEqual(forecast["start_balance"], 2500.00)
+        self.assertEqual(sum(p["change"] for p in forecast["points"]), self.test_recurring["amount"])
+        self.assertEqual(forecast["points"][-1]["balance"], 2500.00 + self.test_recurring["amount"])
+        
+        # Test 2: Unknown granularities are rejected
+        response = requests.get(f"{BACKEND_URL}/analytics/forecast", params={"granularity": "year"})
+        self.assertEqual(response.status_code, 422)
+    
+    def test_analytics_anomalies(self):
+        print("Testing analytics anomalies...")
+        requests.post(f"{BACKEND_URL}/transactions", json=self.test_expense)
+        repeated = {**self.test_expense, "description": self.test_expense["description"].upper()}
+        requests.post(f"{BACKEND_URL}/transactions", json=repeated)
+        
+        # Test 1: The same amount and description on the same day is an exact duplicate
+        response = requests.get(f"{BACKEND_URL}/analytics/anomalies")
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual(report["scanned"], 2)
+        self.assertEqual(report["duplicate_groups"], 1)
+        self.assertTrue(report["duplicates"][0]["exact"])
+        self.assertEqual(len(report["duplicates"][0]["ids"]), 2)
+        
+        # Test 2: Too few rows per category to flag outliers
+        self.assertEqual(report["outliers"], [])
+        
+        # Test 3: Unknown methods are rejected
+        response = requests.get(f"{BACKEND_URL}/analytics/anomalies", params={"method": "mad"})
+        self.assertEqual(response.status_code, 422)
+    
     # MongoDB Integration Tests
+    def test_metrics_endpoint(self):
+        print("Testing metrics endpoint...")
+        requests.get(f"{BACKEND_URL}/analytics/summary")
+        
+        # Served at the app root, not under /api
+        response = requests.get(f"{BACKEND_URL.rsplit('/api', 1)[0]}/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("text/plain", response.headers["content-type"])
+        self.assertIn('http_requests_total{method="GET",route="/api/analytics/summary"', response.text)
+        self.assertIn("http_requests_in_flight", response.text)
+        self.assertIn("mongo_command_duration_seconds", response.text)
+    
     def test_data_persistence(self):
         print("Testing data persistence...")
         # Create multiple transactions
@@ -10,10 +10,9 @@ BACKEND_URL = "http://localhost:8001/api"
 def clean_test_data():
     # Get all transactions and delete them
     response = requests.get(f"{BACKEND_URL}/transactions")
-    if response.status_code == 200:
-        transactions = response.json()
-        for transaction in transactions:
-            requests.delete(f"{BACKEND_URL}/transactions/{transaction['id']}")
+    if response.status_code == 200 and response.json():
+        ids = [transaction["id"] for transaction in response.json()]
+        requests.delete(f"{BACKEND_URL}/transactions/bulk", params={"ids": ids})
     
     # Get all recurring transactions and delete them
     response = requests.get(f"{BACKEND_URL}/recurring")
@@ -10,18 +10,53 @@ import axios from "axios";
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+const toISODate = (date) =>
+  `${date.getFullYear()}-${String(date.getMonth() + 1).padStart(2, "0")}-${String(date.getDate()).padStart(2, "0")}`;
+
+// Backend date filters for each dashboard period, so only that period's rows are fetched
+const periodRange = (period, now = new Date()) => {
+  switch (period) {
+    case "last-3-months": {
+      const threeMonthsAgo = new Date(now);
+      threeMonthsAgo.setMonth(now.getMonth() - 3);
+      return { start_date: toISODate(threeMonthsAgo) };
+    }
+    case "yearly":
+      return { start_date: `${now.getFullYear()}-01-01`, end_date: `${now.getFullYear()}-12-31` };
+    default:
+      return {
+        start_date: toISODate(new Date(now.getFullYear(), now.getMonth(), 1)),
+        end_date: toISODate(new Date(now.getFullYear(), now.getMonth() + 1, 0)),
+      };
+  }
+};
+
+const inRange = (transaction, { start_date, end_date }) =>
+  transaction.date >= start_date && (!end_date || transaction.date <= end_date);
+
 function App() {
   const [transactions, setTransactions] = useState([]);
   const [recurringTransactions, setRecurringTransactions] = useState([]);
+  const [period, setPeriod] = useState("current-month");
   const [loading, setLoading] = useState(true);
 
-  // Fetch transactions from backend
-  const fetchTransactions = async () => {
+  // Fetch the selected period's transactions from backend
+  const fetchTransactions = async (selectedPeriod) => {
     try {
-      const response = await axios.get(`${API}/transactions`);
-      setTransactions(response.data);
+      // Follow the keyset cursor until the backend stops returning one
+      const periodTransactions = [];
+      let after = null;
+      do {
+        const response = await axios.get(`${API}/transactions`, {
+          params: { ...periodRange(selectedPeriod), ...(after ? { after } : {}) },
+        });
+        periodTransactions.push(...response.data);
+        after = response.headers["x-next-cursor"];
+      } while (after);
+      return periodTransactions;
     } catch (error) {
       console.error("Error fetching transactions:", error);
+      return [];
     }
   };
 
@@ -36,18 +71,29 @@ function App() {
   };
 
   useEffect(() => {
-    const loadData = async () => {
-      setLoading(true);
-      await Promise.all([fetchTransactions(), fetchRecurringTransactions()]);
-      setLoading(false);
-    };
-    loadData();
+    fetchRecurringTransactions();
   }, []);
 
+  // Changing the period refetches just that range; a slower earlier request is ignored
+  useEffect(() => {
+    let cancelled = false;
+    fetchTransactions(period).then(periodTransactions => {
+      if (!cancelled) {
+        setTransactions(periodTransactions);
+        setLoading(false);
+      }
+    });
+    return () => {
+      cancelled = true;
+    };
+  }, [period]);
+
   const addTransaction = async (transaction) => {
     try {
       const response = await axios.post(`${API}/transactions`, transaction);
-      setTransactions(prev => [...prev, response.data]);
+      if (inRange(response.data, periodRange(period))) {
+        setTransactions(prev => [...prev, response.data]);
+      }
       return response.data;
     } catch (error) {
       console.error("Error adding transaction:", error);
@@ -58,7 +104,9 @@ function App() {
   const updateTransaction = async (id, updatedTransaction) => {
     try {
       const response = await axios.put(`${API}/transactions/${id}`, updatedTransaction);
-      setTransactions(prev => prev.map(t => t.id === id ? response.data : t));
+      setTransactions(prev => prev
+        .map(t => t.id === id ? response.data : t)
+        .filter(t => inRange(t, periodRange(period))));
       return response.data;
     } catch (error) {
       console.error("Error updating transaction:", error);
@@ -130,6 +178,8 @@ function App() {
                 recurringTransactions={recurringTransactions}
                 onUpdateTransaction={updateTransaction}
                 onDeleteTransaction={deleteTransaction}
+                period={period}
+                onPeriodChange={setPeriod}
               />
             } />
             <Route path="/add-transaction" element={
@@ -9,11 +9,17 @@ import { PlusCircle, Edit2, Trash2, TrendingUp, TrendingDown, DollarSign, Calend
 import Charts from "./Charts";
 import { useToast } from "../hooks/use-toast";
 
-const Dashboard = ({ transactions, recurringTransactions, onUpdateTransaction, onDeleteTransaction }) => {
-  const [selectedPeriod, setSelectedPeriod] = useState("current-month");
+const Dashboard = ({ transactions, recurringTransactions, onUpdateTransaction, onDeleteTransaction, period, onPeriodChange }) => {
+  const [localPeriod, setLocalPeriod] = useState("current-month");
   const { toast } = useToast();
+  // When the parent controls the period it fetches only that range, so there is nothing left to filter
+  const selectedPeriod = onPeriodChange ? period : localPeriod;
+  const setSelectedPeriod = onPeriodChange || setLocalPeriod;
 
   const filteredTransactions = useMemo(() => {
+    if (onPeriodChange) {
+      return transactions;
+    }
     const now = new Date();
     
     switch (selectedPeriod) {
@@ -36,7 +42,7 @@ const Dashboard = ({ transactions, recurringTransactions, onUpdateTransaction, o
       default:
         return transactions;
     }
-  }, [transactions, selectedPeriod]);
+  }, [transactions, selectedPeriod, onPeriodChange]);
 
   const summary = useMemo(() => {
     const income = filteredTransactions
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Startup budget for the API worker, measured with `python -X importtime`.
+
+Run with `python -m pytest tests/test_import_time.py -s` to print the
+import profile. Override the budget with IMPORT_TIME_BUDGET_MS.
+"""
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+IMPORT_TIME_BUDGET_MS = float(os.environ.get("IMPORT_TIME_BUDGET_MS", "1200"))
+# Imported only by the features that need them, never at boot
+LAZY_MODULES = ("numpy", "pandas", "pyarrow", "typer", "redis", "boto3", "jq")
+RUNS = 3
+
+
+def profile_server_import() -> tuple:
+    """Profile one `import server`: ({module: (self_us, cumulative_us)}, modules server imported directly)."""
+    env = dict(os.environ)
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("DB_NAME", "import_time_test")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules, children, direct = {}, [], []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        modules[name] = (int(self_us), int(cumulative_us))
+        # importtime prints a module after its children, so the depth-1 entries
+        # since the last top-level module are what that module imported
+        if depth == 1:
+            children.append(name)
+        elif depth == 0:
+            if name == "server":
+                direct = children
+            children = []
+    return modules, direct
+
+
+def summarize(profile: tuple, top: int = 10) -> str:
+    # Modules imported directly by server, ranked by what they cost including their dependencies
+    modules, direct = profile
+    direct = sorted(direct, key=lambda name: modules[name][1], reverse=True)
+    lines = [f"server: {modules['server'][1] / 1000:.1f} ms total, {modules['server'][0] / 1000:.1f} ms self"]
+    lines += [f"  {name:<24} {modules[name][1] / 1000:8.1f} ms" for name in direct[:top]]
+    return "\n".join(lines)
+
+
+class ImportTimeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # The first run also writes bytecode caches; keep the fastest of the rest
+        profile_server_import()
+        cls.profiles = [profile_server_import() for _ in range(RUNS)]
+        cls.best = min(cls.profiles, key=lambda profile: profile[0]["server"][1])
+        print(summarize(cls.best))
+
+    def test_server_import_within_budget(self):
+        total_ms = self.best[0]["server"][1] / 1000
+        self.assertLessEqual(
+            total_ms,
+            IMPORT_TIME_BUDGET_MS,
+            f"Importing server took {total_ms:.0f} ms (budget {IMPORT_TIME_BUDGET_MS:.0f} ms)\n{summarize(self.best)}",
+        )
+
+    def test_heavy_modules_are_lazy(self):
+        eager = sorted(name for name in LAZY_MODULES if name in self.best[0])
+        self.assertEqual(eager, [], f"Imported at startup: {', '.join(eager)}\n{summarize(self.best)}")
+
+
+if __name__ == "__main__":
+    unittest.main()